@@ -1,18 +1,10 @@
-import pandas as pd
 import numpy as np
-import datasets
-import re
 import time
-import math
-import evaluate
-import torch
 
-from transformers import pipeline
 from pathlib import Path
-from sklearn.model_selection import train_test_split
-from transformers import AutoTokenizer
-from transformers import DataCollatorForSeq2Seq
-from transformers import AutoModelForSeq2SeqLM, Seq2SeqTrainingArguments, Seq2SeqTrainer
+from BASL.summary_generator import SummaryGenerator, checkpoint_id
+# The training dependencies (transformers' Trainer and evaluate) are imported in the methods that use them, so
+# importing this module does not pay for them; summarizing with a saved model only needs BASL.inference
 
 
 class AbstractiveBillSummarizer:
@@ -36,11 +28,63 @@ class AbstractiveBillSummarizer:
         self.prepare_data()
         # Define the initial model
         self.define_model()
-        
+
+    @classmethod
+    def from_pretrained(cls, model_directory, batch_size = 8, max_batch_tokens = None, quantized = False, backend = "pytorch",
+                        cache = None, preset = "pipeline"):
+        """
+        Method to create an AbstractiveBillSummarizer for inference only: the saved model and tokenizer are loaded
+        once, without tokenizing a dataset or building a trainer (and its fresh t5-small model)
+        Params:
+            model_directory: directory written by save
+            batch_size, max_batch_tokens, quantized, backend, cache, preset: see test
+        """
+        summarizer = cls.__new__(cls)
+        summarizer.model_directory = model_directory
+        summarizer.generator = SummaryGenerator.from_pretrained(model_directory,
+                                                                batch_size = batch_size,
+                                                                max_batch_tokens = max_batch_tokens,
+                                                                quantized = quantized,
+                                                                backend = backend,
+                                                                cache = cache,
+                                                                preset = preset)
+        summarizer.tokenizer = summarizer.generator.tokenizer
+        summarizer.generation_stats = {}
+        return summarizer
+
+    def summarize(self, texts):
+        """
+        Method to summarize a list of texts with the loaded model
+        Params:
+            texts: list of bill (or chunk) texts
+        Returns the summaries in the same order as the texts
+        """
+        summaries = self.generator.summarize(list(texts))
+        self.generation_stats = self.generator.last_run_stats
+        return summaries
+
+    def summarize_bills(self, bills):
+        """
+        Method to summarize the chunks of many bills with the loaded model
+        Params:
+            bills: data frame with the text of each chunk (and optionally the input_ids of each chunk from the
+                document splitter)
+        Returns the chunk summaries in row order
+        """
+        # All chunks (of one or many bills) are generated in batches and come back in row order; chunks that
+        # were already tokenized by the document splitter go straight to generation
+        if "input_ids" in bills:
+            summaries = self.generator.summarize_ids(list(bills.input_ids))
+        else:
+            summaries = self.generator.summarize(list(bills.text))
+        self.generation_stats = self.generator.last_run_stats
+        return summaries
+
     def load_tokenizer(self):
         """
         Method to load a tokenizer based on the input checkpoint
         """
+        from transformers import AutoTokenizer
         self.tokenizer = AutoTokenizer.from_pretrained(self.checkpoint)
     
     def preprocess_function(self, examples):
@@ -61,6 +105,7 @@ class AbstractiveBillSummarizer:
         """
         Method that  tokenizes and processes the text data and defines a collator for the model
         """
+        from transformers import DataCollatorForSeq2Seq
         self.tokenized_billsum = self.billsum.map(self.preprocess_function, batched = True)
         self.data_collator = DataCollatorForSeq2Seq(tokenizer = self.tokenizer, model = self.checkpoint)
 
@@ -68,6 +113,7 @@ class AbstractiveBillSummarizer:
         """
         Methood that passes predictions and labels to compute the ROUGE metric - used for model training
         """
+        import evaluate
         rouge = evaluate.load("rouge")
         predictions, labels = eval_pred
         decoded_preds = self.tokenizer.batch_decode(predictions, skip_special_tokens=True)
@@ -82,6 +128,7 @@ class AbstractiveBillSummarizer:
         """
         Method to define the model for training
         """
+        from transformers import AutoModelForSeq2SeqLM, Seq2SeqTrainingArguments, Seq2SeqTrainer
         model = AutoModelForSeq2SeqLM.from_pretrained(self.checkpoint)
         training_args = Seq2SeqTrainingArguments(
         #   output_dir = "/content/gdrive/My Drive/my_awesome_billsum_model",
@@ -126,17 +173,40 @@ class AbstractiveBillSummarizer:
         self.model_directory = model_directory
         self.trainer.save_model(self.model_directory)
 
-    def test(self, test_bill_text):
+    def test(self, test_bill_text, batch_size = 8, max_batch_tokens = None, quantized = False, backend = "pytorch", cache = None,
+             preset = "pipeline"):
         """
         Method to test the model on a new input bill text
         Params:
-            test_bill_text: input text for the model to summarize
-        """
-        summarizer = pipeline("summarization", model = str(self.model_directory))
-        compiled_summary = []
-        for each_bill_part in list(test_bill_text.text):
-            model_summary = summarizer(each_bill_part)
-            compiled_summary.append(model_summary[0]['summary_text'])
+            test_bill_text: data frame with the input text for the model to summarize (and optionally the
+                input_ids of each chunk from the document splitter)
+            batch_size: largest number of bill chunks sent through the model in one generate call
+            max_batch_tokens: if given, batch chunks of similar length under this padded token budget
+            quantized: run the int8 dynamic-quantized model (saved next to the checkpoint) for faster CPU inference
+            backend: "pytorch", or "onnxruntime" to generate with the ONNX export made by bin/export_onnx.py
+            cache: optional SummaryCache; chunks summarized before by the same model are not generated again (None
+                keeps the cache of an already loaded model)
+            preset: generation preset, a name in GENERATION_PRESETS (e.g. "greedy-fast" to give each chunk a decode
+                budget from its length) or a dictionary of the same form
+        """
+        # Reuse the model loaded by from_pretrained (or an earlier test) when it is the same checkpoint, variant and
+        # batching; only a different one is loaded from disk
+        generator = getattr(self, "generator", None)
+        if generator is None or generator.model_id != checkpoint_id(self.model_directory, quantized, backend) \
+                or (generator.batch_size, generator.max_batch_tokens) != (batch_size, max_batch_tokens):
+            self.generator = SummaryGenerator.from_pretrained(self.model_directory,
+                                                              batch_size = batch_size,
+                                                              max_batch_tokens = max_batch_tokens,
+                                                              quantized = quantized,
+                                                              backend = backend,
+                                                              cache = cache,
+                                                              preset = preset)
+        else:
+            # Keep the cache the generator was loaded with unless a different one is passed
+            if cache is not None:
+                generator.cache = cache
+            generator.preset = preset
+        compiled_summary = self.summarize_bills(test_bill_text)
 
         print("Actual Summary:\n\t", test_bill_text.summary.unique())
         print("Model Summary:\n\t", ' '.join(compiled_summary))
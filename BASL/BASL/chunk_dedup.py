@@ -0,0 +1,91 @@
+import zlib
+import hashlib
+import numpy as np
+
+# Prime just above 2**32, so the 32-bit shingle hashes stay distinct under the universal hash family below
+HASH_PRIME = 4294967311
+
+
+def shingle_hashes(text, shingle_size = 5):
+    """
+    Function to hash the word shingles (runs of shingle_size consecutive words) of a chunk to 32-bit ints
+    Params:
+        text: chunk text
+        shingle_size: number of words per shingle; a shorter chunk is a single shingle
+    """
+    words = text.lower().split()
+    shingles = [" ".join(words[i:i + shingle_size]) for i in range(max(len(words) - shingle_size + 1, 1))]
+    return np.unique(np.array([zlib.crc32(shingle.encode()) for shingle in shingles], dtype = np.uint64))
+
+
+def minhash_signatures(texts, num_perm = 128, shingle_size = 5, seed = 0):
+    """
+    Function to compute the MinHash signature of each chunk; two signatures agree in about the same fraction
+    of positions as the Jaccard similarity of the two chunks' shingle sets
+    Params:
+        texts: list of chunk texts
+        num_perm: number of hash functions (signature length)
+        shingle_size: number of words per shingle
+        seed: seed of the random hash functions, so signatures are comparable across runs
+    Returns an array with one row of num_perm minimum hashes per chunk
+    """
+    rng = np.random.default_rng(seed)
+    # a < 2**31 and hashes < 2**32 keep a * hash + b below 2**64
+    a = rng.integers(1, 2**31, size = num_perm, dtype = np.uint64)[:, None]
+    b = rng.integers(0, 2**32, size = num_perm, dtype = np.uint64)[:, None]
+    signatures = np.empty((len(texts), num_perm), dtype = np.uint64)
+    for i, text in enumerate(texts):
+        signatures[i] = ((a * shingle_hashes(text, shingle_size)[None, :] + b) % HASH_PRIME).min(axis = 1)
+    return signatures
+
+
+def dedup_chunks(texts, threshold = 0.9, num_perm = 128, bands = 16, shingle_size = 5):
+    """
+    Function to group chunks that are exact duplicates (same text up to whitespace) or near duplicates (estimated
+    Jaccard similarity of their word shingles at least threshold) so each group only has to be summarized once;
+    near-duplicate candidates come from locality sensitive hashing of the MinHash signatures in bands
+    Params:
+        texts: list of chunk texts
+        threshold: smallest estimated Jaccard similarity of near duplicates; above 1 only exact duplicates are merged
+        num_perm: MinHash signature length, which must be divisible by bands
+        bands: number of LSH bands; more bands find less similar candidates
+        shingle_size: number of words per shingle
+    Returns the index of the representative chunk (the first chunk of its group) for every chunk and the dedup stats
+    """
+    texts = list(texts)
+    parents = list(range(len(texts)))
+    # Exact duplicates: the same normalized text hashes to the same digest
+    first_by_digest = {}
+    for i, text in enumerate(texts):
+        digest = hashlib.sha1(" ".join(text.split()).encode()).digest()
+        parents[i] = first_by_digest.setdefault(digest, i)
+    unique = [i for i in range(len(texts)) if parents[i] == i]
+    exact_duplicates = len(texts) - len(unique)
+
+    near_duplicates = 0
+    if threshold <= 1 and len(unique) > 1:
+        signatures = minhash_signatures([texts[i] for i in unique], num_perm, shingle_size)
+        rows = num_perm // bands
+        candidates = set()
+        for band in range(bands):
+            buckets = {}
+            for position, key in enumerate(map(bytes, signatures[:, band * rows:(band + 1) * rows])):
+                buckets.setdefault(key, []).append(position)
+            for bucket in buckets.values():
+                candidates.update((bucket[0], other) for other in bucket[1:])
+        # Join each chunk to the first earlier group representative its signature agrees with in enough positions,
+        # so every near duplicate is similar to the chunk that is summarized for it (not only to a chain of others)
+        for first, other in sorted(candidates):
+            if parents[unique[first]] == unique[first] and parents[unique[other]] == unique[other] \
+                    and np.mean(signatures[first] == signatures[other]) >= threshold:
+                parents[unique[other]] = unique[first]
+                near_duplicates += 1
+    # Exact duplicates of a near duplicate follow it to its representative
+    representatives = np.array([parents[parents[i]] for i in range(len(texts))])
+    unique_chunks = int(np.sum(representatives == np.arange(len(texts))))
+    stats = {"chunks": len(texts),
+             "unique_chunks": unique_chunks,
+             "exact_duplicates": exact_duplicates,
+             "near_duplicates": near_duplicates,
+             "avoided_fraction": round(1 - unique_chunks / len(texts), 4) if texts else 0.0}
+    return representatives, stats
@@ -0,0 +1,11 @@
+# Inference-only entry point: summarize with saved checkpoints (e.g. AbstractiveBillSummarizer.from_pretrained)
+# without the training dependencies (evaluate, datasets and the transformers Trainer); torch and transformers
+# are only imported once a model is loaded
+from BASL.summary_generator import (SummaryGenerator, SummaryCache, GENERATION_PRESETS, BACKENDS, generation_budget,
+                                    load_quantized_model, export_onnx_model, load_onnx_model, model_size_bytes)
+from BASL.chunk_dedup import dedup_chunks
+from BASL.abstractive_bill_summarizer import AbstractiveBillSummarizer
+
+__all__ = ["SummaryGenerator", "SummaryCache", "GENERATION_PRESETS", "BACKENDS", "generation_budget",
+           "load_quantized_model", "export_onnx_model", "load_onnx_model", "model_size_bytes", "dedup_chunks",
+           "AbstractiveBillSummarizer"]
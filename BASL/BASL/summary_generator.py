@@ -0,0 +1,543 @@
+import os
+import json
+import math
+import time
+import hashlib
+import sqlite3
+import threading
+
+from collections import OrderedDict
+
+# torch and transformers take seconds to import, so they are imported by the functions that load and run a
+# model; importing this module (or BASL.inference) to parse arguments or set up a cache stays fast
+
+# File the int8 dynamic-quantized weights of a checkpoint are saved to, inside the checkpoint directory
+QUANTIZED_WEIGHTS_NAME = "quantized_int8.pt"
+# Subdirectory of a checkpoint that the ONNX encoder and decoders are exported to
+ONNX_SUBDIRECTORY = "onnx"
+# Inference backends a SummaryGenerator can generate with
+BACKENDS = ("pytorch", "onnxruntime")
+# Named generation presets: the generate() settings on top of the pipeline's, and the decode budget of a chunk
+# from its input length (see generation_budget); "pipeline" gives every chunk the pipeline's fixed max_length
+GENERATION_PRESETS = {
+    "pipeline": {"generation": {}, "length_ratio": None},
+    "greedy-fast": {"generation": {"num_beams": 1, "early_stopping": False, "length_penalty": 1.0, "no_repeat_ngram_size": 3},
+                    "length_ratio": 0.25, "min_fraction": 0.25, "min_new_tokens": 16, "max_new_tokens": 128, "step": 16},
+    "beam-quality": {"generation": {"num_beams": 4, "early_stopping": True, "length_penalty": 2.0, "no_repeat_ngram_size": 3},
+                     "length_ratio": 0.5, "min_fraction": 0.25, "min_new_tokens": 32, "max_new_tokens": 200, "step": 16},
+}
+
+
+class SummaryGenerator:
+    """
+    Generate summaries for many bill chunks at once with a saved seq2seq summarization model
+    """
+    def __init__(self, model, tokenizer, batch_size = 8, max_batch_tokens = None, cache = None, model_id = None,
+                 preset = "pipeline"):
+        """
+        Define a SummaryGenerator object
+        Params:
+            model: a loaded seq2seq model
+            tokenizer: the tokenizer that belongs to the model
+            batch_size: largest number of chunks sent through one generate call
+            max_batch_tokens: if given, chunks are bucketed by length and each batch is capped at this many
+                padded input tokens instead of a fixed chunk count
+            cache: optional SummaryCache that chunk summaries are looked up in before generating them
+            model_id: identifies the model and its revision in the cache keys (see checkpoint_id)
+            preset: default generation preset, a name in GENERATION_PRESETS or a dictionary of the same form
+        """
+        self.model = model
+        self.tokenizer = tokenizer
+        self.batch_size = batch_size
+        self.max_batch_tokens = max_batch_tokens
+        self.cache = cache
+        self.model_id = model_id or getattr(model.config, "_name_or_path", "")
+        self.preset = preset
+        self.last_run_stats = {}
+        self.last_decode_steps = []
+        self.last_chunk_decode_steps = []
+        # Use the same prefix and generation settings as the Hugging Face summarization pipeline
+        task_params = dict((model.config.task_specific_params or {}).get("summarization", {}))
+        self.prefix = task_params.pop("prefix", None) or ""
+        self.generation_kwargs = task_params
+
+    @classmethod
+    def from_pretrained(cls, model_directory, batch_size = 8, max_batch_tokens = None, quantized = False, backend = "pytorch",
+                        cache = None, preset = "pipeline"):
+        """
+        Method to load the model and tokenizer saved in a checkpoint directory
+        Params:
+            model_directory: directory written by AbstractiveBillSummarizer.save
+            batch_size: largest number of chunks sent through one generate call
+            max_batch_tokens: padded input token budget per batch (see __init__)
+            quantized: load the int8 dynamic-quantized model for CPU inference instead of the fp32 model
+            backend: "pytorch", or "onnxruntime" to generate with the ONNX export of the checkpoint
+            cache: optional SummaryCache shared with other runs and processes
+            preset: default generation preset (see __init__)
+        """
+        if backend not in BACKENDS:
+            raise ValueError(f"Unknown backend {backend!r}, expected one of {BACKENDS}")
+        from transformers import AutoTokenizer, AutoModelForSeq2SeqLM
+        tokenizer = AutoTokenizer.from_pretrained(str(model_directory))
+        if backend == "onnxruntime":
+            model = load_onnx_model(model_directory)
+        else:
+            model = load_quantized_model(model_directory) if quantized else AutoModelForSeq2SeqLM.from_pretrained(str(model_directory))
+            model.eval()
+        return cls(model, tokenizer, batch_size, max_batch_tokens, cache, checkpoint_id(model_directory, quantized, backend), preset)
+
+    def encode(self, texts):
+        """
+        Method to tokenize texts (with the summarization prefix) into unpadded input id lists
+        """
+        # The tokenizer cannot encode an empty batch
+        if not texts:
+            return []
+        return self.tokenizer([self.prefix + text for text in texts])["input_ids"]
+
+    def get_preset(self, preset = None):
+        """
+        Method to look up a generation preset by name (None for the default preset of this generator)
+        """
+        preset = self.preset if preset is None else preset
+        if isinstance(preset, dict):
+            return preset
+        if preset not in GENERATION_PRESETS:
+            raise ValueError(f"Unknown generation preset {preset!r}, expected one of {tuple(GENERATION_PRESETS)}")
+        return GENERATION_PRESETS[preset]
+
+    def get_generation_kwargs(self, preset):
+        """
+        Method to get the generate() settings of a preset; an adaptive preset sets the length of every batch
+        itself, so the pipeline's fixed max_length and min_length are left out
+        """
+        generation_kwargs = {**self.generation_kwargs, **preset["generation"]}
+        if preset["length_ratio"]:
+            generation_kwargs.pop("max_length", None)
+            generation_kwargs.pop("min_length", None)
+        return generation_kwargs
+
+    def summarize(self, texts, preset = None):
+        """
+        Method to summarize a list of texts batch by batch
+        Params:
+            texts: list of chunk texts
+            preset: generation preset (see get_preset)
+        Returns the summaries in the same order as the input texts
+        """
+        return self.summarize_ids(self.encode(list(texts)), preset)
+
+    def summarize_ids(self, input_ids, preset = None):
+        """
+        Method to summarize already tokenized chunks batch by batch; with a cache, only the chunks it has no
+        summary for (under this model and these generation settings) are generated
+        Params:
+            input_ids: list of input id lists, one per chunk
+            preset: generation preset (see get_preset)
+        Returns the summaries in the same order as the input chunks
+        """
+        preset = self.get_preset(preset)
+        if self.cache is None:
+            return self.generate_batches(input_ids, preset)
+        namespace = json.dumps([self.model_id, self.generation_kwargs, preset], sort_keys = True)
+        keys = [self.cache.make_key(namespace, ids) for ids in input_ids]
+        # Look every distinct chunk up once and generate each missing one once, however often it repeats
+        first_position = {}
+        for i, key in enumerate(keys):
+            first_position.setdefault(key, i)
+        summaries = self.cache.get_many(list(first_position))
+        missing = [key for key in first_position if key not in summaries]
+        generated = dict(zip(missing, self.generate_batches([input_ids[first_position[key]] for key in missing], preset)))
+        self.cache.put_many(generated)
+        summaries.update(generated)
+        self.last_run_stats["cache_hits"] = len(keys) - len(missing)
+        return [summaries[key] for key in keys]
+
+    def generate_batches(self, input_ids, preset = None):
+        """
+        Method to generate the summaries of tokenized chunks batch by batch, recording the run's throughput and
+        the decode steps of every chunk
+        """
+        start = time.time()
+        preset = self.get_preset(preset)
+        generation_kwargs = self.get_generation_kwargs(preset)
+        lengths = [len(ids) for ids in input_ids]
+        # Chunks share a generate call only if they have the same decode budget, so a chunk's summary does not
+        # depend on the chunks it happens to be batched with
+        groups = {}
+        for i, length in enumerate(lengths):
+            groups.setdefault(generation_budget(length, preset) if preset["length_ratio"] else None, []).append(i)
+        batches = []
+        for budget, indices in groups.items():
+            group_lengths = [lengths[i] for i in indices]
+            if self.max_batch_tokens:
+                group_batches = plan_token_batches(group_lengths, self.max_batch_tokens, self.batch_size)
+            else:
+                group_batches = [list(range(i, min(i + self.batch_size, len(indices)))) for i in range(0, len(indices), self.batch_size)]
+            batches += [(budget, [indices[j] for j in batch]) for batch in group_batches]
+        summaries = [None] * len(input_ids)
+        self.last_chunk_decode_steps = [0] * len(input_ids)
+        padded_tokens, batch_decode_steps = 0, 0
+        for budget, batch in batches:
+            padded_tokens += len(batch) * max(lengths[i] for i in batch)
+            budget_kwargs = {} if budget is None else {"min_new_tokens": budget[0], "max_new_tokens": budget[1]}
+            # Scatter the batch results back to the positions the chunks came from
+            batch_summaries = self.generate_ids([input_ids[i] for i in batch], **generation_kwargs, **budget_kwargs)
+            for i, summary, steps in zip(batch, batch_summaries, self.last_decode_steps):
+                summaries[i] = summary
+                self.last_chunk_decode_steps[i] = steps
+            batch_decode_steps += max(self.last_decode_steps, default = 0)
+        seconds = time.time() - start
+        self.last_run_stats = batch_stats(sum(lengths), padded_tokens, len(input_ids), len(batches), seconds,
+                                          sum(self.last_chunk_decode_steps), batch_decode_steps)
+        return summaries
+
+    def summarize_bills(self, bills, preset = None):
+        """
+        Method to summarize the chunks of many bills in shared batches
+        Params:
+            bills: list with one list of chunk texts (in doc_number order) per bill
+            preset: generation preset (see get_preset)
+        Returns one list of chunk summaries per bill, in doc_number order
+        """
+        flat_summaries = self.summarize([chunk for chunks in bills for chunk in chunks], preset)
+        bill_summaries, start = [], 0
+        for chunks in bills:
+            bill_summaries.append(flat_summaries[start:start + len(chunks)])
+            start += len(chunks)
+        return bill_summaries
+
+    def generate_ids(self, input_ids, **generation_kwargs):
+        """
+        Method to run a single padded generate call over a batch of tokenized chunks, with the given generate()
+        settings instead of the pipeline's if there are any; the number of tokens decoded for each chunk (up to
+        and including its end of sequence token) is kept in last_decode_steps
+        """
+        import torch
+        inputs = self.tokenizer.pad({"input_ids": input_ids}, return_tensors = "pt")
+        with torch.no_grad():
+            output_ids = self.model.generate(**inputs, **(generation_kwargs or self.generation_kwargs))
+        # Every output starts with the decoder start token and finished chunks are padded to the longest one
+        self.last_decode_steps = (output_ids[:, 1:] != self.tokenizer.pad_token_id).sum(dim = 1).tolist()
+        return self.tokenizer.batch_decode(output_ids, skip_special_tokens = True, clean_up_tokenization_spaces = False)
+
+    def warmup(self):
+        """
+        Method to run one short generation so the first real request does not pay for it
+        """
+        self.generate_ids(self.encode(["the bill takes effect upon passage"]), **{**self.generation_kwargs, "max_length": 8, "min_length": 1})
+
+
+class SummaryCache:
+    """
+    Two-tier cache of chunk summaries: a size-bounded in-memory LRU in front of an optional SQLite file that
+    persists across runs and is shared by the processes of a server
+    """
+    def __init__(self, path = None, max_memory_bytes = 16 * 2**20, max_disk_bytes = 512 * 2**20):
+        """
+        Define a SummaryCache object
+        Params:
+            path: SQLite file of the persistent tier, or None to only cache in memory
+            max_memory_bytes: size of the keys and summaries kept in memory before the least recently used go
+            max_disk_bytes: size of the keys and summaries kept on disk before the least recently used rows
+                are deleted
+        """
+        self.path = str(path) if path else None
+        self.max_memory_bytes = max_memory_bytes
+        self.max_disk_bytes = max_disk_bytes
+        self.memory = OrderedDict()
+        self.memory_bytes = 0
+        self.lock = threading.Lock()
+        self.connection = None
+        self.pid = None
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.memory_evictions = 0
+        self.disk_evictions = 0
+
+    @staticmethod
+    def make_key(namespace, input_ids):
+        """
+        Method to make the key of one chunk: a hash of the namespace (model id, revision and generation
+        settings) and of the chunk's token ids, which are the cleaned chunk text under the model's tokenizer
+        """
+        digest = hashlib.sha256(namespace.encode())
+        digest.update(json.dumps(list(input_ids)).encode())
+        return digest.hexdigest()
+
+    def connect(self):
+        """
+        Method to open the SQLite file of this process; a connection does not survive a fork, so a forked
+        server worker opens its own
+        """
+        if self.pid != os.getpid():
+            self.connection = sqlite3.connect(self.path, timeout = 30, check_same_thread = False)
+            # Write-ahead logging lets the server processes read while one of them writes
+            self.connection.execute("PRAGMA journal_mode=WAL")
+            self.connection.execute("CREATE TABLE IF NOT EXISTS summaries "
+                                    "(key TEXT PRIMARY KEY, summary TEXT NOT NULL, size INTEGER NOT NULL, last_used REAL NOT NULL)")
+            self.connection.execute("CREATE INDEX IF NOT EXISTS summaries_last_used ON summaries (last_used)")
+            self.connection.commit()
+            self.pid = os.getpid()
+        return self.connection
+
+    def get_many(self, keys):
+        """
+        Method to look up distinct keys, first in memory and then on disk
+        Returns a dictionary with the summary of every key that was found
+        """
+        with self.lock:
+            found = {}
+            for key in keys:
+                if key in self.memory:
+                    self.memory.move_to_end(key)
+                    found[key] = self.memory[key]
+            self.memory_hits += len(found)
+            missing = [key for key in keys if key not in found]
+            if missing and self.path:
+                connection = self.connect()
+                rows = []
+                # Stay under SQLite's limit on the number of parameters of one statement
+                for start in range(0, len(missing), 500):
+                    part = missing[start:start + 500]
+                    rows += connection.execute(f"SELECT key, summary FROM summaries WHERE key IN ({','.join('?' * len(part))})",
+                                               part).fetchall()
+                now = time.time()
+                connection.executemany("UPDATE summaries SET last_used = ? WHERE key = ?", [(now, key) for key, _ in rows])
+                connection.commit()
+                for key, summary in rows:
+                    found[key] = summary
+                    self.remember(key, summary)
+                self.disk_hits += len(rows)
+            self.misses += len(keys) - len(found)
+            return found
+
+    def put_many(self, summaries):
+        """
+        Method to store a dictionary of key to summary in both tiers
+        """
+        if not summaries:
+            return
+        with self.lock:
+            for key, summary in summaries.items():
+                self.remember(key, summary)
+            if self.path:
+                connection = self.connect()
+                now = time.time()
+                connection.executemany("INSERT OR REPLACE INTO summaries VALUES (?, ?, ?, ?)",
+                                       [(key, summary, entry_size(key, summary), now) for key, summary in summaries.items()])
+                self.evict_disk(connection)
+                connection.commit()
+
+    def remember(self, key, summary):
+        """
+        Method to put a summary in the in-memory LRU, evicting the least recently used beyond its size limit
+        """
+        if key in self.memory:
+            self.memory_bytes -= entry_size(key, self.memory.pop(key))
+        self.memory[key] = summary
+        self.memory_bytes += entry_size(key, summary)
+        while self.memory_bytes > self.max_memory_bytes and self.memory:
+            evicted_key, evicted_summary = self.memory.popitem(last = False)
+            self.memory_bytes -= entry_size(evicted_key, evicted_summary)
+            self.memory_evictions += 1
+
+    def evict_disk(self, connection):
+        """
+        Method to delete the least recently used rows until the summaries on disk fit their size limit
+        """
+        excess = connection.execute("SELECT COALESCE(SUM(size), 0) FROM summaries").fetchone()[0] - self.max_disk_bytes
+        if excess <= 0:
+            return
+        evicted = []
+        for key, size in connection.execute("SELECT key, size FROM summaries ORDER BY last_used"):
+            evicted.append((key,))
+            excess -= size
+            if excess <= 0:
+                break
+        connection.executemany("DELETE FROM summaries WHERE key = ?", evicted)
+        self.disk_evictions += len(evicted)
+
+    def get_stats(self):
+        """
+        Method to report the hit and miss counters and the size of both tiers
+        """
+        with self.lock:
+            lookups = self.memory_hits + self.disk_hits + self.misses
+            stats = {"memory_hits": self.memory_hits,
+                     "disk_hits": self.disk_hits,
+                     "misses": self.misses,
+                     "hit_rate": round((self.memory_hits + self.disk_hits) / lookups, 4) if lookups else 0.0,
+                     "memory_entries": len(self.memory),
+                     "memory_mb": round(self.memory_bytes / 2**20, 2),
+                     "memory_evictions": self.memory_evictions,
+                     "disk_evictions": self.disk_evictions}
+            if self.path:
+                entries, size = self.connect().execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM summaries").fetchone()
+                stats.update({"disk_entries": entries, "disk_mb": round(size / 2**20, 2)})
+            return stats
+
+
+def entry_size(key, summary):
+    """
+    Function to get the number of bytes a cache entry is counted as
+    """
+    return len(key) + len(summary.encode())
+
+
+def checkpoint_id(model_directory, quantized = False, backend = "pytorch"):
+    """
+    Function to identify the weights a checkpoint generates with: its absolute path, its revision (when its
+    config.json was last saved) and the quantized and backend variant, since those can change the summaries
+    """
+    config_path = os.path.join(str(model_directory), "config.json")
+    revision = os.path.getmtime(config_path) if os.path.exists(config_path) else None
+    return f"{os.path.abspath(str(model_directory))}@{revision}:{'int8' if quantized else 'fp32'}:{backend}"
+
+
+def quantize_model(model):
+    """
+    Function to apply dynamic int8 quantization to the linear layers of a model; weights are stored as int8 and
+    activations are quantized on the fly, which makes CPU inference faster and the model about 4x smaller
+    """
+    import torch
+    return torch.ao.quantization.quantize_dynamic(model.eval(), {torch.nn.Linear}, dtype = torch.qint8)
+
+
+def load_quantized_model(model_directory):
+    """
+    Function to load the int8 quantized model of a checkpoint; the quantized weights are made from the fp32
+    checkpoint and saved next to it the first time (or when the checkpoint is newer), and loaded after that
+    Params:
+        model_directory: directory written by AbstractiveBillSummarizer.save
+    """
+    import torch
+    from transformers import AutoConfig, AutoModelForSeq2SeqLM
+    quantized_path = os.path.join(str(model_directory), QUANTIZED_WEIGHTS_NAME)
+    config_path = os.path.join(str(model_directory), "config.json")
+    if os.path.exists(quantized_path) and os.path.getmtime(quantized_path) >= os.path.getmtime(config_path):
+        # Build the quantized modules from the config, then fill them with the saved int8 weights
+        model = quantize_model(AutoModelForSeq2SeqLM.from_config(AutoConfig.from_pretrained(str(model_directory))))
+        model.load_state_dict(torch.load(quantized_path, weights_only = False))
+        return model
+    model = quantize_model(AutoModelForSeq2SeqLM.from_pretrained(str(model_directory)))
+    # Save under a temporary name and move it into place so a reader never sees a partial file
+    tmp_path = f"{quantized_path}.tmp"
+    torch.save(model.state_dict(), tmp_path)
+    os.replace(tmp_path, quantized_path)
+    return model
+
+
+def onnx_model_class():
+    """
+    Function to import the ONNX Runtime seq2seq model class of the optional optimum[onnxruntime] package, with
+    an error that names the package when it is not installed
+    """
+    try:
+        from optimum.onnxruntime import ORTModelForSeq2SeqLM
+    except ImportError as e:
+        raise ImportError("The onnxruntime backend needs the optimum[onnxruntime] package: "
+                          "pip install \"optimum[onnxruntime]\" onnxruntime") from e
+    return ORTModelForSeq2SeqLM
+
+
+def export_onnx_model(model_directory, output_directory = None):
+    """
+    Function to export the encoder and the decoders (with and without past key values) of a checkpoint to ONNX
+    with the optional optimum[onnxruntime] package; returns the directory the export was written to
+    Params:
+        model_directory: directory written by AbstractiveBillSummarizer.save
+        output_directory: where to write the export, by default the onnx subdirectory of the checkpoint
+    """
+    from transformers import AutoTokenizer
+    ORTModelForSeq2SeqLM = onnx_model_class()
+    output_directory = output_directory or os.path.join(str(model_directory), ONNX_SUBDIRECTORY)
+    model = ORTModelForSeq2SeqLM.from_pretrained(str(model_directory), export = True, use_cache = True)
+    model.save_pretrained(output_directory)
+    AutoTokenizer.from_pretrained(str(model_directory)).save_pretrained(output_directory)
+    return output_directory
+
+
+def load_onnx_model(model_directory):
+    """
+    Function to load the ONNX Runtime model exported from a checkpoint by bin/export_onnx.py; it generates with
+    the same generate() interface as the PyTorch model, reusing past key values between decoding steps
+    Params:
+        model_directory: directory written by AbstractiveBillSummarizer.save
+    """
+    onnx_directory = os.path.join(str(model_directory), ONNX_SUBDIRECTORY)
+    if not os.path.isdir(onnx_directory):
+        raise FileNotFoundError(f"No ONNX export in {onnx_directory}, run bin/export_onnx.py {model_directory} first")
+    return onnx_model_class().from_pretrained(onnx_directory, use_cache = True)
+
+
+def model_size_bytes(model):
+    """
+    Function to get the size of a model's weights in bytes, counting the packed int8 weights of quantized
+    layers (which are not parameters) and tied weights once; an ONNX Runtime model counts its exported files
+    """
+    import torch
+    if not isinstance(model, torch.nn.Module):
+        return sum(os.path.getsize(os.path.join(str(model.model_save_dir), name))
+                   for name in os.listdir(str(model.model_save_dir)) if ".onnx" in name)
+    size, seen = 0, set()
+    for value in model.state_dict().values():
+        for tensor in value if isinstance(value, tuple) else (value,):
+            if isinstance(tensor, torch.Tensor) and tensor.data_ptr() not in seen:
+                seen.add(tensor.data_ptr())
+                size += tensor.numel() * tensor.element_size()
+    return size
+
+
+def generation_budget(input_length, preset):
+    """
+    Function to get the (min_new_tokens, max_new_tokens) decode budget of a chunk from its input length under an
+    adaptive preset: max_new_tokens is length_ratio of the input tokens rounded up to a multiple of step and kept
+    between the preset's min_new_tokens and max_new_tokens, and min_new_tokens is min_fraction of that
+    """
+    step = preset.get("step", 1)
+    max_new_tokens = math.ceil(preset["length_ratio"] * input_length / step) * step
+    max_new_tokens = min(max(max_new_tokens, preset["min_new_tokens"]), preset["max_new_tokens"])
+    return int(max_new_tokens * preset["min_fraction"]), max_new_tokens
+
+
+def plan_token_batches(lengths, max_batch_tokens, max_batch_size = None):
+    """
+    Function to group chunks of similar token length into batches whose padded size (number of chunks
+    times the longest chunk) stays within a token budget; a chunk longer than the budget gets its own batch
+    Params:
+        lengths: token length of each chunk
+        max_batch_tokens: padded token budget per batch
+        max_batch_size: optional cap on the number of chunks per batch
+    Returns a list of batches, each a list of chunk indices
+    """
+    batches, batch = [], []
+    # Sorting by length means the chunk being added is always the longest in its batch
+    for i in sorted(range(len(lengths)), key = lambda i: lengths[i]):
+        over_budget = (len(batch) + 1) * lengths[i] > max_batch_tokens
+        over_size = max_batch_size is not None and len(batch) >= max_batch_size
+        if batch and (over_budget or over_size):
+            batches.append(batch)
+            batch = []
+        batch.append(i)
+    if batch:
+        batches.append(batch)
+    return batches
+
+
+def batch_stats(input_tokens, padded_tokens, chunks, batches, seconds, decode_steps = 0, batch_decode_steps = 0):
+    """
+    Function to summarize the throughput, padding waste and decode steps of one summarization run; decode_steps
+    counts the tokens decoded for each chunk and batch_decode_steps the decoding steps each generate call ran
+    """
+    return {"chunks": chunks,
+            "batches": batches,
+            "input_tokens": input_tokens,
+            "padded_tokens": padded_tokens,
+            "padding_waste": round(1 - input_tokens / padded_tokens, 4) if padded_tokens else 0.0,
+            "seconds": round(seconds, 3),
+            "tokens_per_second": round(input_tokens / seconds, 1) if seconds else 0.0,
+            "decode_steps": decode_steps,
+            "decode_steps_per_chunk": round(decode_steps / chunks, 1) if chunks else 0.0,
+            "batch_decode_steps": batch_decode_steps}
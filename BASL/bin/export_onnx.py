@@ -0,0 +1,18 @@
+import argparse
+import time
+from pathlib import Path
+from BASL.summary_generator import export_onnx_model
+
+# run script with `python export_onnx.py models/summarizer_model`
+# the export is written to models/summarizer_model/onnx, where `main.py --backend onnxruntime` looks for it
+if __name__ == "__main__":
+    # the script requires a checkpoint directory written by AbstractiveBillSummarizer.save
+    parser = argparse.ArgumentParser(
+        description="Export a saved summarizer checkpoint to ONNX for the ONNX Runtime backend")
+    parser.add_argument("model_dir", help="Checkpoint directory to export")
+    parser.add_argument("-o", "--output_dir", help="Directory to write the ONNX files to (default: <model_dir>/onnx)")
+    args = parser.parse_args()
+
+    start = time.time()
+    output_dir = export_onnx_model(Path(args.model_dir), args.output_dir)
+    print(f"Exported {args.model_dir} to {output_dir} in {time.time() - start:.1f}s")
@@ -4,8 +4,10 @@ from pathlib import Path
 # from abs_summarizer.abstractive_bill_summarizer import AbstractiveBillSummarizer
 # import abs_summarizer
 from BASL.abstractive_bill_summarizer import AbstractiveBillSummarizer
+from BASL.summary_generator import SummaryCache, GENERATION_PRESETS
+from BASL.chunk_dedup import dedup_chunks
 import pandas as pd
-import datasets
+import json
 import os
 
 os.environ['KMP_DUPLICATE_LIB_OK']='True'
@@ -18,8 +20,31 @@ if __name__ == "__main__":
         description="Whether to use summarizer that splits documents or not")
     parser.add_argument("filename", help="File name with bill texts")
     parser.add_argument("-nosplit", '--nosplit_flag', help="Model type", action = 'store_true')
+    parser.add_argument("-b", "--batch_size", help="Largest number of chunks per generate call", type = int, default = 32)
+    parser.add_argument("-t", "--max_batch_tokens", help="Padded token budget per generate call (0 for fixed-size batches in file order)",
+                        type = int, default = 4096)
+    parser.add_argument("-q", "--quantized", help="Use the int8 dynamic-quantized model for CPU inference", action = 'store_true')
+    parser.add_argument("--backend", help="Inference backend (onnxruntime needs the export from export_onnx.py)",
+                        choices = ["pytorch", "onnxruntime"], default = "pytorch")
+    parser.add_argument("-c", "--cache_file", help="SQLite file caching chunk summaries across runs (empty string to disable)",
+                        default = str(Path('models')/'summary_cache.sqlite'))
+    parser.add_argument("-d", "--dedup_threshold", help="Shingle similarity at which chunks count as near duplicates and are summarized once "
+                        "(above 1 to only merge exact duplicates)", type = float, default = 0.9)
+    parser.add_argument("-p", "--preset", help="Generation preset: the pipeline's fixed lengths, or decode budgets from each chunk's length",
+                        choices = list(GENERATION_PRESETS), default = "pipeline")
+    parser.add_argument("--length_ratio", help="Decode budget per input token of an adaptive preset (overrides the preset's)", type = float)
+    parser.add_argument("--max_new_tokens", help="Largest decode budget of an adaptive preset (overrides the preset's)", type = int)
     args = parser.parse_args()
 
+    # with an adaptive preset every chunk is allowed a number of decode steps in proportion to its input length
+    preset = dict(GENERATION_PRESETS[args.preset])
+    if (args.length_ratio is not None or args.max_new_tokens is not None) and not preset["length_ratio"]:
+        parser.error("--length_ratio and --max_new_tokens need an adaptive preset such as greedy-fast")
+    if args.length_ratio is not None:
+        preset["length_ratio"] = args.length_ratio
+    if args.max_new_tokens is not None:
+        preset["max_new_tokens"] = args.max_new_tokens
+
     # establish data directory and read in data
     # depending where this script is used it will navigate to find the /raw_data folder differently
     path_parts = Path().absolute().parts
@@ -38,25 +63,39 @@ if __name__ == "__main__":
     else:
         model_output_path = Path().absolute()/'models'/'summarizer_model'
         df = df.rename({'split_text': 'text'}, axis='columns')
-    # create the dataset to pass into the summarizer    
-    # train df will be arbitrary since we're not training the model and test will be the entire dataset
-    df = df[['state', 'text', 'summary', 'bill_id']]
-    train_df = df.head().copy(deep=True)
-    test_df = df.copy(deep=True)
-    print(test_df.head())
-    train_dataset = datasets.Dataset.from_dict(train_df)
-    test_dataset = datasets.Dataset.from_dict(test_df.astype(str))
-    billsum = datasets.DatasetDict({"train": train_dataset, "test": test_dataset})
+    # chunks written by data_processing.py carry their input ids, so generation can skip tokenizing them again
+    token_columns = ['input_ids'] if 'input_ids' in df.columns else []
+    if token_columns:
+        df['input_ids'] = df['input_ids'].apply(json.loads)
+    df = df[['state', 'text', 'summary', 'bill_id'] + token_columns]
+    print(df.head())
 
-    # create the summarizer object
-    my_summarizer = AbstractiveBillSummarizer(output_directory_path = model_output_path,
-        checkpoint = 't5-small',
-        billsum_dataset = billsum
-        )
-    my_summarizer.model_directory = model_output_path
+    # chunks summarized by an earlier run of the same model are read from the cache instead of generated
+    cache = SummaryCache(args.cache_file) if args.cache_file else None
+    # load the saved model and tokenizer once for inference (no dataset to tokenize and no trainer to build)
+    # chunks are bucketed by token length and batched under the token budget, then scattered back to their rows
+    my_summarizer = AbstractiveBillSummarizer.from_pretrained(model_output_path, batch_size = args.batch_size,
+                                                              max_batch_tokens = args.max_batch_tokens, quantized = args.quantized,
+                                                              backend = args.backend, cache = cache, preset = preset)
+    # companion bills and bills copied from model legislation share identical or near-identical chunks, so only
+    # the first chunk of every group of duplicates is summarized and its summary is fanned back out to the group
+    representatives, dedup_stats = dedup_chunks(df.text, threshold = args.dedup_threshold)
+    unique_rows = sorted(set(representatives))
+    avoided_tokens = (f", {1 - df.input_ids.iloc[unique_rows].map(len).sum() / df.input_ids.map(len).sum():.1%} of the input tokens"
+                      if token_columns else "")
+    print(f"Deduplicated {dedup_stats['chunks']} chunks to {dedup_stats['unique_chunks']} ({dedup_stats['exact_duplicates']} exact and "
+          f"{dedup_stats['near_duplicates']} near duplicates): avoided {dedup_stats['avoided_fraction']:.1%} of the chunks{avoided_tokens}")
     # run the summaries
-    summaries = my_summarizer.test(df)
-    df['model_summary'] = summaries
+    unique_summaries = my_summarizer.summarize_bills(df.iloc[unique_rows])
+    stats = my_summarizer.generation_stats
+    print(f"Generated {stats['chunks']} chunks in {stats['batches']} batches: "
+          f"{stats['tokens_per_second']} input tokens/sec, padding waste {stats['padding_waste']:.1%}")
+    print(f"Decoded {stats['decode_steps']} tokens ({stats['decode_steps_per_chunk']} per chunk) in "
+          f"{stats['batch_decode_steps']} batched decoding steps with the {args.preset} preset")
+    if cache is not None:
+        print(f"Summary cache: {cache.get_stats()}")
+    summary_of_row = dict(zip(unique_rows, unique_summaries))
+    df['model_summary'] = [summary_of_row[row] for row in representatives]
     if not args.nosplit_flag:
         # create the joined bill text 
         df.sort_values(by=['state', 'bill_id', 'doc_number'],
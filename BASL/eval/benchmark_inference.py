@@ -0,0 +1,100 @@
+import argparse
+import logging
+import resource
+import time
+import os
+import pandas as pd
+import multiprocessing
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
+from rouge import Rouge
+
+from BASL.summary_generator import SummaryGenerator, ONNX_SUBDIRECTORY, export_onnx_model, load_quantized_model, model_size_bytes
+
+def setup_logger(log_file_name, log_dir_path):
+    logger = logging.getLogger(__name__)
+    logger.setLevel(logging.INFO)
+    log_file_path = os.path.join(log_dir_path, log_file_name)
+    file_handler = logging.FileHandler(log_file_path)
+    formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
+    file_handler.setFormatter(formatter)
+    logger.addHandler(file_handler)
+    return logger
+
+# Model variants that can be compared: PyTorch fp32, PyTorch int8 dynamic-quantized and the ONNX Runtime export
+VARIANTS = {"fp32": {"quantized": False, "backend": "pytorch"},
+            "int8": {"quantized": True, "backend": "pytorch"},
+            "onnx": {"quantized": False, "backend": "onnxruntime"}}
+
+def prepare_variants(model_directory, variants):
+    """ Make sure the quantized weights and the ONNX export of a checkpoint exist, without sending the models back """
+    if "int8" in variants:
+        load_quantized_model(model_directory)
+    if "onnx" in variants and not os.path.isdir(os.path.join(str(model_directory), ONNX_SUBDIRECTORY)):
+        export_onnx_model(model_directory)
+
+def run_model(model_directory, variant, texts, references, batch_size):
+    """ Load one variant of the model, summarize the texts and return its latency, memory and ROUGE numbers """
+    start = time.time()
+    summarizer = SummaryGenerator.from_pretrained(model_directory, batch_size = batch_size, **VARIANTS[variant])
+    load_seconds = time.time() - start
+    summarizer.warmup()
+    summaries = summarizer.summarize(texts)
+    stats = summarizer.last_run_stats
+    scores = Rouge().get_scores(summaries, references, avg = True, ignore_empty = True)
+    return {"model": variant,
+            "load_seconds": round(load_seconds, 2),
+            "weights_mb": round(model_size_bytes(summarizer.model) / 2**20, 1),
+            # ru_maxrss is in kilobytes on Linux; every variant runs in a fresh process so this is its own peak
+            "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+            "seconds": stats["seconds"],
+            "seconds_per_chunk": round(stats["seconds"] / max(stats["chunks"], 1), 3),
+            "tokens_per_second": stats["tokens_per_second"],
+            "rouge-1": round(scores["rouge-1"]["f"], 4),
+            "rouge-2": round(scores["rouge-2"]["f"], 4),
+            "rouge-l": round(scores["rouge-l"]["f"], 4)}
+
+def compare(model_directory, texts, references, batch_size, variants):
+    """ Run each model variant in its own fresh process and return a report with each variant's delta to fp32 """
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers = 1, mp_context = context) as pool:
+        # Quantize and export first so their one-time cost is not counted as load time
+        pool.submit(prepare_variants, model_directory, variants).result()
+    rows = []
+    for variant in variants:
+        with ProcessPoolExecutor(max_workers = 1, mp_context = context) as pool:
+            rows.append(pool.submit(run_model, model_directory, variant, texts, references, batch_size).result())
+    report = pd.DataFrame(rows).set_index("model")
+    if "fp32" in variants:
+        for variant in variants:
+            if variant != "fp32":
+                report.loc[f"{variant} - fp32"] = report.loc[variant] - report.loc["fp32"]
+    return report
+
+if __name__ == "__main__":
+
+    startTime = time.time()
+    timeTag = time.strftime('%Y%m%d_%H_%M_%S')
+
+    # Read arguments
+    parser = argparse.ArgumentParser(description = "Code to compare the CPU latency, throughput, memory and ROUGE of the summarizer variants")
+    parser.add_argument("-m", "--model_dir", default = str(Path('models')/Path('summarizer_model')), help = "Path to the saved model checkpoint")
+    parser.add_argument("-f", "--infile", default = str(Path('tests')/Path('data')/Path('test_bill_sum.csv')), help = "CSV file with text and summary columns")
+    parser.add_argument("-b", "--batch_size", type = int, default = 8, help = "Largest number of chunks per generate call")
+    parser.add_argument("-v", "--variants", nargs = "+", choices = list(VARIANTS), default = list(VARIANTS), help = "Model variants to compare")
+    parser.add_argument("-o", "--outdir", required = True, help = "Path to output and logging")
+    args = parser.parse_args()
+
+    # Begin logger
+    logger = setup_logger(f'log_{timeTag}.log', args.outdir)
+    logger.info('Running inference benchmark script')
+    logger.info(f'Model directory: {args.model_dir}')
+    logger.info(f'Input file: {args.infile}')
+
+    df = pd.read_csv(args.infile)
+    report = compare(args.model_dir, list(df.text), list(df.summary), args.batch_size, args.variants)
+    logger.info(f'Latency, throughput, memory and ROUGE of {", ".join(args.variants)} on {len(df)} texts\n{report.to_string()}')
+
+    outputFile = os.path.join(args.outdir, f"inference_benchmark_{timeTag}.csv")
+    report.to_csv(outputFile)
+    logger.info(f'Saved report to {outputFile}. Finished in {time.time() - startTime:.2f}s')
@@ -0,0 +1,95 @@
+"""
+Time the compiled bill text normalization against the original regex passes.
+Run it as a module from the BASL directory, so the utils package (and the default input file) resolve:
+    cd BASL && python -m eval.benchmark_text_cleaning -o DIR
+"""
+import argparse
+import logging
+import time
+import os
+import re
+from pathlib import Path
+
+from utils.bill_text_cleaner_splitter import normalize_bill_text, shorten_bill_text
+
+def setup_logger(log_file_name, log_dir_path):
+    logger = logging.getLogger(__name__)
+    logger.setLevel(logging.INFO)
+    log_file_path = os.path.join(log_dir_path, log_file_name)
+    file_handler = logging.FileHandler(log_file_path)
+    formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
+    file_handler.setFormatter(formatter)
+    logger.addHandler(file_handler)
+    return logger
+
+def reference_initial_clean(text):
+    """ The original pass-by-pass normalization, kept to check the compiled version against """
+    text = re.sub(r'\s+', "", text.lower())
+    header_expressions = [r'hb\d+', r'\\[a-z]+\b', r'\\\d+\b', r'hb\d+', r'sb\d+', r'hf\d+', r'sf\d+', r'\d+']
+    for exp in header_expressions:
+        text = re.sub(exp, "sectionheaderflag", text)
+    return re.sub(r'[^\w\s]', "", text)
+
+def reference_text_shortener(bill_text):
+    """ The original shortener, kept to check the compiled version against """
+    enact_str = r"be it enacted by|enact as follows|state of [a-z]+ enact|assembly of [a-z ]+ enact"
+    if re.search(enact_str, bill_text.lower()):
+        enacted_by_index = re.search(enact_str, bill_text.lower()).start()
+    else:
+        enacted_by_index = 0
+    shortened_str = bill_text[enacted_by_index:]
+    if "section" in shortened_str.lower():
+        first_section_index = re.search("section", shortened_str.lower()).start()
+    else:
+        first_section_index = 0
+    shortened_str = shortened_str[first_section_index:]
+    s = re.sub(r'new text underlined deleted text bracketed', ' ', shortened_str, flags = re.IGNORECASE)
+    s = re.sub(r'\b(\w)\s?\1\s?\1\b', ' ', s)
+    s = re.sub(r'(?<!\b[a])\b\w\b(?!([a]\b|\w))', '', s)
+    return s.replace("section header flag", ".")
+
+def best_time(function, text, repeats):
+    """ Best wall time of several runs of a function over a text """
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        function(text)
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+if __name__ == "__main__":
+
+    startTime = time.time()
+    timeTag = time.strftime('%Y%m%d_%H_%M_%S')
+
+    # Read arguments
+    parser = argparse.ArgumentParser(description = "Code to time the bill text normalization against the original regex passes "
+                                     "(run from the BASL directory with `python -m eval.benchmark_text_cleaning -o DIR`)")
+    parser.add_argument("-f", "--infile", default = str(Path('tests')/Path('data')/Path('long_text.txt')), help = "Text file to clean")
+    parser.add_argument("-n", "--copies", type = int, default = 10, help = "Number of copies of the text to clean at once")
+    parser.add_argument("-r", "--repeats", type = int, default = 5, help = "Number of timed runs (the best is reported)")
+    parser.add_argument("-o", "--outdir", required = True, help = "Path to logging")
+    args = parser.parse_args()
+
+    # Begin logger
+    logger = setup_logger(f'log_{timeTag}.log', args.outdir)
+    logger.info('Running text cleaning benchmark script')
+    logger.info(f'Input file: {args.infile}')
+
+    with open(args.infile) as f:
+        text = f.read() * args.copies
+
+    # The compiled passes must give exactly the same text before they are worth timing
+    normalized = normalize_bill_text(text)
+    assert normalized == reference_initial_clean(text), "normalize_bill_text differs from the original passes"
+    spaced = " ".join(re.findall(r'\S{1,9}', normalized))
+    assert shorten_bill_text(spaced) == reference_text_shortener(spaced), "shorten_bill_text differs from the original passes"
+
+    for name, original, compiled, sample in [("initial clean", reference_initial_clean, normalize_bill_text, text),
+                                             ("text shortener", reference_text_shortener, shorten_bill_text, spaced)]:
+        before = best_time(original, sample, args.repeats)
+        after = best_time(compiled, sample, args.repeats)
+        logger.info(f'{name}: {len(sample)} characters, original {before:.4f}s, compiled {after:.4f}s, '
+                    f'speedup {before / after:.2f}x')
+
+    logger.info(f'Finished in {time.time() - startTime:.2f}s')
@@ -4,11 +4,16 @@ from utils.bill_text_cleaner_splitter import *
 from utils.aclu_table_scraper import *
 # from abs_summarizer.abstractive_bill_summarizer import AbstractiveBillSummarizer
 from BASL.abstractive_bill_summarizer import AbstractiveBillSummarizer
+from BASL.summary_generator import SummaryGenerator, plan_token_batches, load_quantized_model, SummaryCache, generation_budget, GENERATION_PRESETS
+from BASL.chunk_dedup import dedup_chunks
 import numpy as np
 import unittest
 import pytest
 import pandas as pd
-import datasets
+from transformers import AutoTokenizer, T5Config, T5ForConditionalGeneration
+import torch
+import subprocess
+import sys
 
 # make sure the bill_text_scraper is in the right format and reads in data
 # PASSED
@@ -43,16 +48,171 @@ def test_aclu_table_scraper():
 def test_summarizer():
     model_output_path = Path().absolute()/'models'/'summarizer_model'
     df = pd.read_csv(Path().absolute()/Path('tests')/Path('data')/Path('test_bill_sum.csv'))
-    train_df = df[df.dataset_type == 'train']
     test_df = df[df.dataset_type == 'test']
-    train_dataset = datasets.Dataset.from_dict(train_df)
-    test_dataset = datasets.Dataset.from_dict(test_df)
-    billsum = datasets.DatasetDict({"train": train_dataset, "test": test_dataset})
-
-    my_summarizer = AbstractiveBillSummarizer(output_directory_path = model_output_path,
-        checkpoint = 't5-small',
-        billsum_dataset = billsum
-        )
-    my_summarizer.model_directory = model_output_path
-    test_summary = my_summarizer.test(test_df)
-    assert ((type(test_summary) == list) and (len(' '.join(test_summary)) < len(' '.join(test_df.text))))
\ No newline at end of file
+
+    my_summarizer = AbstractiveBillSummarizer.from_pretrained(model_output_path)
+    test_summary = my_summarizer.summarize_bills(test_df)
+    assert ((type(test_summary) == list) and (len(' '.join(test_summary)) < len(' '.join(test_df.text))))
+
+# make sure the token budget scheduler covers every chunk once and keeps batches under the budget
+def test_plan_token_batches():
+    lengths = [512, 12, 40, 300, 511, 7, 90, 256, 256, 3]
+    batches = plan_token_batches(lengths, max_batch_tokens = 1024, max_batch_size = 4)
+    assert sorted(i for batch in batches for i in batch) == list(range(len(lengths)))
+    assert all(len(batch) <= 4 for batch in batches)
+    assert all(len(batch) * max(lengths[i] for i in batch) <= 1024 for batch in batches)
+
+
+# make sure summarizing no texts gives no summaries instead of sending an empty batch to the tokenizer
+def test_summarize_empty():
+    config = T5Config(vocab_size = 100, d_model = 32, d_kv = 8, d_ff = 64, num_layers = 2, num_heads = 4, decoder_start_token_id = 0)
+    assert SummaryGenerator(T5ForConditionalGeneration(config), tokenizer = None).summarize([]) == []
+
+
+# make sure the trie word segmenter infers the same spaces as the original dynamic program
+def test_word_segmenter_matches_original():
+    words = open(Path().absolute()/Path('modified_data')/Path('our_words.txt')).read().split()
+    wordcost = dict((k, np.log((i+1)*np.log(len(words)))) for i,k in enumerate(words))
+    maxword = max(len(x) for x in words)
+    def original_infer_spaces(s):
+        def best_match(i):
+            candidates = enumerate(reversed(cost[max(0, i-maxword):i]))
+            return min((c + wordcost.get(s[i-k-1:i], 9e999), k+1) for k,c in candidates)
+        cost = [0]
+        for i in range(1,len(s)+1):
+            c,k = best_match(i)
+            cost.append(c)
+        out = []
+        i = len(s)
+        while i>0:
+            c,k = best_match(i)
+            out.append(s[i-k:i])
+            i -= k
+        return " ".join(reversed(out))
+    long_text = open(Path().absolute()/Path('tests')/Path('data')/Path('long_text.txt'), "r").read()
+    text = re.sub(r'[^a-z]', "", long_text.lower())[:3000] + "qzxsectionheaderflagthebillzz"
+    assert WordSegmenter(wordcost, maxword).segment(text) == original_infer_spaces(text)
+
+
+# make sure the memory-mapped compiled lexicon segments text the same way as the word cost dictionary
+def test_compiled_lexicon(tmp_path):
+    words = open(Path().absolute()/Path('modified_data')/Path('our_words.txt')).read().split()[:5000]
+    (tmp_path/'words.txt').write_text('\n'.join(words))
+    wordcost = dict((k, log((i+1)*log(len(words)))) for i,k in enumerate(words))
+    lexicon = load_lexicon(str(tmp_path/'words.txt'))
+    text = ''.join(words[::7])[:2000] + 'zzqsectionheaderflagxq'
+    assert WordSegmenter(lexicon = lexicon).segment(text) == WordSegmenter(wordcost).segment(text)
+
+
+# make sure the compiled normalization flags headers and drops punctuation like the original passes
+def test_normalize_bill_text():
+    text = "Section 1.  \\hb12 HB 4, SB12 and \\b\n(sf3) hf7-\\12 text."
+    assert normalize_bill_text(text) == "section" + "sectionheaderflag" * 3 + "and" + "sectionheaderflag" * 4 + "text"
+
+
+# make sure the process pool cleans bills the same way as one by one and keeps their order
+def test_clean_bills(tmp_path):
+    words = open(Path().absolute()/Path('modified_data')/Path('our_words.txt')).read().split()[:5000]
+    (tmp_path/'words.txt').write_text('\n'.join(words))
+    long_text = open(Path().absolute()/Path('tests')/Path('data')/Path('long_text.txt'), "r").read()
+    texts = [long_text[i*1000:(i+1)*3000] for i in range(4)]
+    segmenter = WordSegmenter(lexicon = load_lexicon(str(tmp_path/'words.txt')))
+    expected = [BillTextCleaner(text, segmenter = segmenter).get_clean_text() for text in texts]
+    assert clean_bills(texts, str(tmp_path/'words.txt'), workers = 2) == expected
+
+
+# make sure the cumulative sum document splitting finds the same split locations as the running sum loop
+def test_token_split_indices():
+    def original_doc_splitting(lengths, max_token_len):
+        total_sum = 0
+        idx_list = []
+        for i,l in enumerate(lengths):
+            if total_sum + l + 1 > max_token_len:
+                idx_list.append(i)
+                total_sum = 0
+            total_sum += l
+        return idx_list
+    rng = np.random.default_rng(0)
+    for max_token_len in [1, 8, 512]:
+        for _ in range(200):
+            lengths = list(rng.integers(0, 2 * max_token_len + 1, size = rng.integers(0, 20)))
+            assert token_split_indices(lengths, max_token_len) == original_doc_splitting(lengths, max_token_len)
+
+
+# make sure the balanced packer uses as few chunks as greedy packing without a larger chunk
+def test_balanced_split_indices():
+    rng = np.random.default_rng(0)
+    for _ in range(200):
+        lengths = rng.integers(0, 512, size = rng.integers(1, 40))
+        greedy = np.split(lengths, token_split_indices(lengths, 512))
+        balanced = np.split(lengths, balanced_split_indices(lengths, 511))
+        assert len(balanced) == len(greedy)
+        assert max(chunk.sum() for chunk in balanced) <= max(chunk.sum() for chunk in greedy)
+        assert np.array_equal(np.concatenate(balanced), lengths)
+
+
+# make sure the chunk input ids from document splitting are what tokenizing the joined chunk text gives
+def test_pack_sections_input_ids():
+    tokenizer = AutoTokenizer.from_pretrained('t5-small')
+    long_text = open(Path().absolute()/Path('tests')/Path('data')/Path('long_text.txt'), "r").read()
+    sections = BillTextSplitter(long_text).get_split_text()
+    chunks, chunk_ids, stats = pack_sections(tokenizer, [sections], prefix = "summarize: ")
+    assert stats[0]["chunks"] == len(chunk_ids[0]) and stats[0]["longest_chunk"] <= 512
+    assert chunk_ids[0] == tokenizer(["summarize: " + " ".join(chunk) for chunk in chunks[0]])["input_ids"]
+
+
+# make sure the int8 model is saved next to the checkpoint and loads back with the same weights
+def test_load_quantized_model(tmp_path):
+    config = T5Config(vocab_size = 100, d_model = 32, d_kv = 8, d_ff = 64, num_layers = 2, num_heads = 4, decoder_start_token_id = 0)
+    T5ForConditionalGeneration(config).save_pretrained(tmp_path)
+    quantized = load_quantized_model(tmp_path)
+    assert (tmp_path/'quantized_int8.pt').exists()
+    reloaded = load_quantized_model(tmp_path)
+    input_ids = torch.tensor([[5, 6, 7, 1]])
+    assert torch.equal(quantized.generate(input_ids = input_ids, max_new_tokens = 5),
+                       reloaded.generate(input_ids = input_ids, max_new_tokens = 5))
+
+
+# make sure cached summaries survive a restart, are counted as hits and are evicted by size on disk
+def test_summary_cache(tmp_path):
+    cache = SummaryCache(tmp_path/'cache.sqlite', max_disk_bytes = 1000)
+    keys = [SummaryCache.make_key("t5-small", [i, 1]) for i in range(3)]
+    cache.put_many({key: f"summary {i}" for i, key in enumerate(keys)})
+    reopened = SummaryCache(tmp_path/'cache.sqlite', max_disk_bytes = 1000)
+    assert reopened.get_many(keys + [SummaryCache.make_key("t5-base", [0, 1])]) == {key: f"summary {i}" for i, key in enumerate(keys)}
+    assert reopened.get_many(keys[:1]) == {keys[0]: "summary 0"}
+    stats = reopened.get_stats()
+    assert (stats["memory_hits"], stats["disk_hits"], stats["misses"]) == (1, 3, 1)
+    reopened.put_many({SummaryCache.make_key("t5-small", [9, 1]): "x" * 900})
+    assert reopened.get_stats()["disk_evictions"] > 0 and reopened.get_stats()["disk_mb"] * 2**20 <= 1000
+
+
+# make sure exact and near-duplicate chunks are summarized through the first chunk of their group
+def test_dedup_chunks():
+    section = " ".join(f"the department shall adopt rule {i} for the school district" for i in range(40))
+    other = " ".join(f"a health care provider may not perform procedure {i} on a minor" for i in range(40))
+    texts = [section, other, "  " + section, section.replace("rule 7 ", "rules 7 "), other + " amended"]
+    representatives, stats = dedup_chunks(texts)
+    assert list(representatives) == [0, 1, 0, 0, 1]
+    assert (stats["unique_chunks"], stats["exact_duplicates"], stats["near_duplicates"]) == (2, 1, 2)
+    assert list(dedup_chunks(texts, threshold = 1.1)[0]) == [0, 1, 0, 3, 4]
+
+
+# make sure adaptive presets give longer chunks more decode steps, within the preset's caps
+def test_generation_budget():
+    preset = GENERATION_PRESETS["greedy-fast"]
+    budgets = [generation_budget(length, preset) for length in (10, 100, 300, 510)]
+    assert budgets == sorted(budgets)
+    assert all(preset["min_new_tokens"] <= high <= preset["max_new_tokens"] and low <= high for low, high in budgets)
+    assert budgets[0][1] == preset["min_new_tokens"] and budgets[-1][1] == preset["max_new_tokens"]
+
+
+# make sure the inference-only entry module stays quick to import: no training dependencies, and torch and
+# transformers only once a model is loaded
+def test_inference_import_time():
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", "import BASL.inference"],
+                            capture_output = True, text = True, check = True, cwd = Path(__file__).parents[1])
+    rows = [line.split("|") for line in result.stderr.splitlines() if line.startswith("import time:") and "[us]" not in line]
+    cumulative_us = {row[2].strip(): int(row[1]) for row in rows}
+    assert not {"torch", "transformers", "evaluate", "datasets", "sklearn"} & set(cumulative_us)
+    assert cumulative_us["BASL.inference"] < 1e6
@@ -1,14 +1,29 @@
 import os
 import re
 import zlib
+import mmap
+import json
+import hashlib
 import logging
 import time
 import argparse
 import pandas as pd
 from pathlib import Path
+from itertools import repeat
+from concurrent.futures import ProcessPoolExecutor
 
 from PyPDF2 import PdfReader
 
+logger = logging.getLogger(__name__)
+
+# Bump whenever scrape_text changes its output so cached extractions are not reused
+EXTRACTOR_VERSION = 1
+
+# Patterns for reading the text out of decompressed Texas page streams
+ENCLOSED_RE = re.compile(r"\((.*)\)")
+PAREN_RE = re.compile(r"\(|\)")
+SPACES_RE = re.compile(r"\n|  ")
+
 def setup_logger(log_file_name, log_dir_path):
     """ Function for logging this script """
     logger = logging.getLogger(__name__)
@@ -20,8 +35,11 @@ def setup_logger(log_file_name, log_dir_path):
     logger.addHandler(file_handler)
     return logger
 
-def read_files():
-    """ Funciton to read in the bill PDFs and scrape the text """
+def read_files(workers = None, cache_path = None):
+    """ Funciton to read in the bill PDFs and scrape the text; the PDFs are read by a pool of worker processes
+    (one per CPU by default, workers = 1 reads them one by one in this process); text already extracted from
+    an unchanged PDF by the same extractor version is served from the extraction cache, so only new or
+    modified PDFs are parsed """
     # Set the initial starting path for the bill pdfs and go through each
     # depending where this script is used it will navigate to find the /raw_data folder differently
     path_parts = Path().absolute().parts
@@ -29,21 +47,44 @@ def read_files():
         path = Path().absolute()/"raw_data"
     elif path_parts[len(path_parts)-2] == 'BASL':
         path = Path().absolute().parents[0]/"raw_data"
-    bill_states, bill_names, bill_texts = [], [], []
-    for filename in os.listdir(path):
-        # Prep for opening the PDF
-        filename_lower = filename.lower()
-        if filename_lower.endswith(".pdf"):
-            full_bill_text = scrape_text(path, filename_lower)
-            # Add full bill text to list
-            bill_texts.append(full_bill_text)
-            # Get the bill name and state and append to lists
-            filename_split1 = filename.split("_")
-            # Add state to state list
-            bill_states.append(filename_split1[0])
-            # Add bill names to list
-            filename_split2 = filename_split1[1].split(".")
-            bill_names.append(filename_split2[0])
+    cache_path = cache_path or path.parent/"modified_data"/"bill_text_cache.json"
+    cache = load_extraction_cache(cache_path)
+    filenames = [filename for filename in os.listdir(path) if filename.lower().endswith(".pdf")]
+    keys = {filename: extraction_cache_key(os.path.join(path, filename)) for filename in filenames}
+    misses = [filename for filename in filenames if keys[filename] not in cache]
+    workers = workers or os.cpu_count()
+    if workers > 1 and len(misses) > 1:
+        with ProcessPoolExecutor(max_workers = workers) as pool:
+            parsed = dict(zip(misses, pool.map(timed_scrape_text, repeat(path), misses, chunksize = 4)))
+    else:
+        parsed = {filename: timed_scrape_text(path, filename) for filename in misses}
+    bill_states, bill_names, bill_texts, timings = [], [], [], []
+    new_cache = {}
+    for filename in filenames:
+        if filename in parsed:
+            full_bill_text, seconds, error = parsed[filename]
+            timings.append((filename, seconds, error or "ok"))
+        else:
+            full_bill_text, error = cache[keys[filename]], None
+            timings.append((filename, 0.0, "cached"))
+        # A PDF that fails to parse is logged and left out instead of stopping the whole run
+        if error is not None:
+            logger.error(f"Could not extract text from {filename}: {error}")
+            continue
+        new_cache[keys[filename]] = full_bill_text
+        # Add full bill text to list
+        bill_texts.append(full_bill_text)
+        # Get the bill name and state and append to lists
+        filename_split1 = filename.split("_")
+        # Add state to state list
+        bill_states.append(filename_split1[0])
+        # Add bill names to list
+        filename_split2 = filename_split1[1].split(".")
+        bill_names.append(filename_split2[0])
+    log_extraction_timings(timings)
+    # Only keep entries for the PDFs that are still there, and skip the write when nothing changed
+    if new_cache.keys() != cache.keys():
+        save_extraction_cache(cache_path, new_cache)
     # Make a dictionary and convert to a data frame
     bills_dict = {"state": bill_states, "bill_name": bill_names, "text": bill_texts}
     bills_df = pd.DataFrame(bills_dict)
@@ -52,38 +93,54 @@ def read_files():
     bills_df = bills_df.reset_index(drop = True)
     return bills_df
 
+def extraction_cache_key(pdf_path):
+    """ Cache key of a PDF: the extractor version plus a hash of the file contents """
+    with open(pdf_path, "rb") as f:
+        return f"{EXTRACTOR_VERSION}:{hashlib.sha256(f.read()).hexdigest()}"
+
+def load_extraction_cache(cache_path):
+    """ Read the extraction cache, a JSON object mapping cache keys to extracted text """
+    if not os.path.exists(cache_path):
+        return {}
+    with open(cache_path) as f:
+        return json.load(f)
+
+def save_extraction_cache(cache_path, cache):
+    """ Write the extraction cache under a temporary name and move it into place """
+    tmp_path = f"{cache_path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(cache, f)
+    os.replace(tmp_path, cache_path)
+
+def timed_scrape_text(path, file_name):
+    """ Scrape one PDF, returning its text, the seconds it took and the error message if it failed """
+    start = time.time()
+    try:
+        return scrape_text(path, file_name), time.time() - start, None
+    except Exception as e:
+        return "", time.time() - start, f"{type(e).__name__}: {e}"
+
+def log_extraction_timings(timings):
+    """ Log a table of the per-file extraction times, slowest first, so slow PDFs are visible """
+    rows = [f"{'file':<24} {'seconds':>8}  status"]
+    for filename, seconds, status in sorted(timings, key = lambda x: x[1], reverse = True):
+        rows.append(f"{filename:<24} {seconds:>8.3f}  {status}")
+    cached = sum(1 for t in timings if t[2] == "cached")
+    logger.info(f"Read {len(timings)} PDFs ({cached} from the extraction cache) in {sum(t[1] for t in timings):.2f} CPU seconds\n"
+                + "\n".join(rows))
+
 
 def scrape_text(path, file_name):
     """ Given a PDF's file name, returns the raw text of that file """
-    # Open the current PDF file
-    pdf = open(os.path.join(path, file_name), "rb")
     full_page_text = ''
     # If this PDF is a texas file, we need to use FlateDecode to decode the file
-    if file_name.startswith("tx"):
-        stream = re.compile(rb'.*?FlateDecode.*?stream(.*?)endstream', re.S)
-        # Stream in the data
-        for s in stream.findall(pdf.read()):
-            s = s.strip(b'\r\n')
-            try:
-                # Decompress the file into bytes and then decode into regular text
-                word_string = zlib.decompress(s)
-                word_string = word_string.decode('utf-8')
-                word_string = word_string.split("\n")
-                # The actual text is enclosed in parentheses
-                page_text = [re.sub('\(|\)', '', re.search("\((.*)\)", i).group(0)) for i in word_string if i.startswith("(")]
-                # Remove numbers
-                page_text = [i for i in page_text if not i.isdigit()]
-                page_text = ' '.join(page_text)
-                # Remove extra spaces
-                page_text = re.sub(r'\n|  ', ' ', page_text)
-                # Append to the full string
-                full_page_text += page_text
-            except Exception as e:
-                pass
+    if file_name.lower().startswith("tx"):
+        full_page_text = ''.join(iter_texas_pages(os.path.join(path, file_name)))
     # If this PDF is not a texas file, read it in with the Python PDF reader
     # Source code: https://gist.github.com/averagesecurityguy/ba8d9ed3c59c1deffbd1390dafa5a3c2
     else:
-        # Create a PDF reader object
+        # Open the current PDF file and create a PDF reader object
+        pdf = open(os.path.join(path, file_name), "rb")
         pdf_reader = PdfReader(pdf)
         # Loop through each page in the PDF document
         for page_number in range(len(pdf_reader.pages)):
@@ -101,6 +158,61 @@ def scrape_text(path, file_name):
         pdf.close()
     return full_page_text
 
+def iter_texas_pages(pdf_path, chunk_size = 1 << 16):
+    """ Lazily yield the text of each FlateDecode stream of a Texas bill PDF; the memory-mapped file is scanned
+    once for stream boundaries (the same streams the pattern .*?FlateDecode.*?stream(.*?)endstream finds) and
+    each stream is decompressed in chunks, so memory and time stay flat as the files grow """
+    with open(pdf_path, "rb") as f, mmap.mmap(f.fileno(), 0, access = mmap.ACCESS_READ) as data:
+        position = 0
+        while True:
+            flate = data.find(b"FlateDecode", position)
+            start = data.find(b"stream", flate + 11) if flate != -1 else -1
+            end = data.find(b"endstream", start + 6) if start != -1 else -1
+            if end == -1:
+                return
+            position = end + 9
+            # Strip the line breaks around the stream data
+            start += 6
+            while start < end and data[start] in b"\r\n":
+                start += 1
+            while end > start and data[end - 1] in b"\r\n":
+                end -= 1
+            word_string = inflate(data, start, end, chunk_size)
+            page_text = flate_page_text(word_string) if word_string is not None else None
+            if page_text is not None:
+                yield page_text
+
+def inflate(data, start, end, chunk_size):
+    """ Decompress data[start:end] chunk by chunk; returns None wherever zlib.decompress would raise """
+    decompressor = zlib.decompressobj()
+    parts = []
+    try:
+        for offset in range(start, end, chunk_size):
+            parts.append(decompressor.decompress(data[offset:min(offset + chunk_size, end)]))
+            # Anything after the end of the compressed stream is ignored
+            if decompressor.eof:
+                break
+        parts.append(decompressor.flush())
+    except zlib.error:
+        return None
+    return b''.join(parts) if decompressor.eof else None
+
+def flate_page_text(word_string):
+    """ Get the text of one decompressed Texas page stream, or None if it cannot be read """
+    try:
+        # Decode into regular text
+        word_string = word_string.decode('utf-8')
+        word_string = word_string.split("\n")
+        # The actual text is enclosed in parentheses
+        page_text = [PAREN_RE.sub('', ENCLOSED_RE.search(i).group(0)) for i in word_string if i.startswith("(")]
+        # Remove numbers
+        page_text = [i for i in page_text if not i.isdigit()]
+        page_text = ' '.join(page_text)
+        # Remove extra spaces
+        return SPACES_RE.sub(' ', page_text)
+    except Exception as e:
+        return None
+
 
 if __name__ == "__main__":
 
@@ -110,6 +222,7 @@ if __name__ == "__main__":
     # Read arguments
     parser = argparse.ArgumentParser(description = "Code to scrape the bill text from each of their PDFs")
     parser.add_argument("-o", "--outdir", required = True, help = "Path to logging")
+    parser.add_argument("-w", "--workers", type = int, default = None, help = "Number of PDF extraction processes (default: one per CPU)")
     args = parser.parse_args()
 
     # Begin logger
@@ -119,7 +232,7 @@ if __name__ == "__main__":
 
     # Read in the pdfs and make a csv file to store them
     logger.info("Getting all of the bill text into a data frame.")
-    bills_df = read_files()
+    bills_df = read_files(workers = args.workers)
     logger.info(f"\n{bills_df}")
     bills_df.to_csv("../modified_data/bill_texts.csv", index = False)
 
@@ -4,8 +4,7 @@ import argparse
 import os
 import pandas as pd
 
-from math import log
-from bill_text_cleaner_splitter import BillTextCleaner, BillTextSplitter
+from bill_text_cleaner_splitter import BillTextSplitter, clean_bills
 
 def setup_logger(log_file_name, log_dir_path):
     """ Function for logging this script """
@@ -78,6 +77,7 @@ if __name__ == "__main__":
     # Read arguments
     parser = argparse.ArgumentParser(description = "Code to combine all of the data, clean it, and split it.")
     parser.add_argument("-o", "--outdir", required = True, help = "Path to logging")
+    parser.add_argument("-w", "--workers", type = int, default = None, help = "Number of text cleaning processes (default: one per CPU)")
     args = parser.parse_args()
 
     # Begin logger
@@ -95,14 +95,12 @@ if __name__ == "__main__":
     # Log the current filtered data
     logger.info(f"\n{filtered_data}")
 
-	# Build a cost dictionary, assuming Zipf's law and cost = -math.log(probability)
-    words = open("../modified_data/our_words.txt").read().split()
-    wordcost = dict((k, log((i+1)*log(len(words)))) for i,k in enumerate(words))
-    maxword = max(len(x) for x in words)
-
-    # Clean and split all bill text
+    # Clean and split all bill text; the cleaning runs in a pool of processes that each memory-map the compiled
+    # lexicon once (word costs assume Zipf's law and cost = -math.log(probability))
     logger.info("Cleaning and splitting all of the bill text.")
-    filtered_data["cleaned_text"] = filtered_data["original_text"].apply(lambda x: BillTextCleaner(x, wordcost, maxword).get_clean_text())
+    clean_start = time.time()
+    filtered_data["cleaned_text"] = clean_bills(filtered_data["original_text"], "../modified_data/our_words.txt", workers = args.workers)
+    logger.info(f"Cleaned {len(filtered_data)} bills in {time.time() - clean_start:.2f}s")
     filtered_data["split_cleaned_text"] = filtered_data["cleaned_text"].apply(lambda x: BillTextSplitter(x).get_split_text())
     filtered_data = filtered_data[["state_name", "state", "bill_id", "bill_name", "original_text", \
                                     "cleaned_text", "split_cleaned_text", "summary", "summary_source", \
@@ -1,13 +1,13 @@
 import pandas as pd
-import re
-from math import log
 from transformers import AutoTokenizer, pipeline
-import numpy as np
 import argparse
 import logging
 import time
 import os
 
+from bill_text_cleaner_splitter import WordSegmenter, clean_bills, normalize_bill_text, shorten_bill_text, \
+	pack_sections
+
 def setup_logger(log_file_name, log_dir_path):
 	'''Function to initialize logger'''
 	logger = logging.getLogger(__name__)
@@ -58,41 +58,18 @@ def initial_cleaning(text):
 	Params:
 		text: a string of bill text
 	"""
-    # Remove all spaces and convert to lower case
-	text = re.sub(r'\s+', "", text.lower())
-    # Find the section headers and flag them with the phrase "sectionheaderflag" for future splitting
-	header_expressions = [r'hb\d+', r'\\[a-z]+\b', r'\\\d+\b', r'hb\d+', r'sb\d+', r'hf\d+', r'sf\d+', r'\d+']
-	for exp in header_expressions:
-		text = re.sub(exp, "sectionheaderflag", text)
-    # Remove additional punctuation
-	final_text = re.sub(r'[^\w\s]', "", text)
-	return final_text
-
-def infer_spaces(s, worcost, maxword):
+	# Remove all spaces, convert to lower case, flag the section headers and remove additional punctuation
+	return normalize_bill_text(text)
+
+def infer_spaces(s, wordcost = None, maxword = None, segmenter = None):
     """Uses dynamic programming to infer the location of spaces in a string without spaces
     Source code: https://stackoverflow.com/questions/8870261/how-to-split-text-without-spaces-into-list-of-words
+    The dynamic program walks a prefix trie of the lexicon (see WordSegmenter); pass a prebuilt segmenter
+    to avoid rebuilding the trie for every bill
     """
-    # Find the best match for the i first characters, assuming cost has
-    # been built for the i-1 first characters.
-    # Returns a pair (match_cost, match_length).
-	# Prepare string (lower and remove all spaces)
-    def best_match(i):
-        candidates = enumerate(reversed(cost[max(0, i-maxword):i]))
-        return min((c + wordcost.get(s[i-k-1:i], 9e999), k+1) for k,c in candidates)
-    # Build the cost array.
-    cost = [0]
-    for i in range(1,len(s)+1):
-        c,k = best_match(i)
-        cost.append(c)
-    # Backtrack to recover the minimal-cost string.
-    out = []
-    i = len(s)
-    while i>0:
-        c,k = best_match(i)
-        assert c == cost[i]
-        out.append(s[i-k:i])
-        i -= k
-    return " ".join(reversed(out))
+    if segmenter is None:
+        segmenter = WordSegmenter(wordcost, maxword)
+    return segmenter.segment(s)
 
 def text_shortener(bill_text):
 	"""
@@ -102,29 +79,8 @@ def text_shortener(bill_text):
 	Params:
 		bill_text: a string of bill text
 	"""
-	enact_str = r"be it enacted by|enact as follows|state of [a-z]+ enact|assembly of [a-z ]+ enact"
-	# Find where the bill is enacted
-	if re.search(enact_str, bill_text.lower()):
-		enacted_by_index = re.search(enact_str, bill_text.lower()).start() 
-	else:
-		enacted_by_index = 0
-	shortened_str = bill_text[enacted_by_index:]
-	# Start at the section
-	if "section" in shortened_str.lower():
-		first_section_index = re.search("section", shortened_str.lower()).start()
-	else:
-		first_section_index = 0
-	shortened_str = shortened_str[first_section_index:]
-    # Common phrase among bill to remove
-	s = re.sub(r'new text underlined deleted text bracketed', ' ', shortened_str, flags = re.IGNORECASE)
-	# Remove any patterns of multiple letters separated by spaces: "a a a" or "aa"
-	s = re.sub(r'\b(\w)\s?\1\s?\1\b', ' ', s)
-	# Remove all single letter characters remaining except for "a" and "i" because those are actual full words
-	s = re.sub(r'(?<!\b[a])\b\w\b(?!([a]\b|\w))', '', s)
-	# Replace section headers with a period for splitting
-	s = s.replace("section header flag", ".")
 	# Returned shortened string
-	return s.strip()
+	return shorten_bill_text(bill_text).strip()
 
 def splitter(text):
     """ 
@@ -155,24 +111,6 @@ def merge_data(indir):
 	merge_all = merge_all.rename(columns = {"full_state_x": "state_name", "text": "original_text", "source": "summary_source"})
 	return merge_all
 
-def doc_splitting(l, max_token_len = 512):
-	'''Function to split the documents dynamically to abide by token limit''' 
-	# Initialize sum and list
-	total_sum = 0
-	idx_list = []
-	# Iterate over each item in list
-	for i,l in enumerate(l):
-	  # Check if adding element to sum causes sum to be over limit
-		if total_sum + l + 1 > max_token_len: # add 1 because the T-5 model only does an end token
-			idx_list.append(i) # add split location to list of indices for splitting
-			total_sum = 0 # reset to 0
-		total_sum += l
-	return idx_list
-
-def text_split(l, idx):
-  '''Function to split a list of text using a list of indices'''
-  return [list(i) for i in np.split(np.array(l), idx)]
-
 if __name__ == "__main__":
 
 	startTime = time.time()
@@ -183,6 +121,7 @@ if __name__ == "__main__":
 	parser.add_argument("-i", "--indir", required=True, help="Path to input files (ACLU text, bill text, etc.)")
 	parser.add_argument("-s", "--split", help="Path to machine summaries data", action='store_false') # default is run non-doc split
 	parser.add_argument("-o", "--outdir", required=True, help="Path to output and logging")
+	parser.add_argument("-w", "--workers", type=int, default=None, help="Number of text cleaning processes (default: one per CPU)")
 	args = parser.parse_args()	
 
 	# Begin logger
@@ -194,15 +133,14 @@ if __name__ == "__main__":
 
 	logger.info('Reading in datasets from the directory')
 	data = merge_data(args.indir)
-	# Build a cost dictionary, assuming Zipf's law and cost = -math.log(probability)
-	words = open(os.path.join(args.indir, "our_words.txt")).read().split() #words = open("../../modified_data/our_words.txt").read().split()
-	wordcost = dict((k, log((i+1)*log(len(words)))) for i,k in enumerate(words))
-	maxword = max(len(x) for x in words)
 
 	logger.info('Beginning text cleaning on combined data')
-	# Clean the text
+	# Clean the text in a pool of processes that each memory-map the compiled lexicon once
+	# (word costs assume Zipf's law and cost = -math.log(probability))
 	# Inital clean -> infer the spaces -> shorten the text -> split it
-	data["cleaned_text"] = data["original_text"].apply(lambda x: text_shortener(infer_spaces(initial_cleaning(x), wordcost, maxword)))
+	clean_start = time.time()
+	data["cleaned_text"] = [text.strip() for text in clean_bills(data["original_text"], os.path.join(args.indir, "our_words.txt"), workers = args.workers)]
+	logger.info(f'Cleaned {len(data)} bills in {time.time() - clean_start:.2f}s')
 	data["split_cleaned_text"] = data["cleaned_text"].apply(lambda x: splitter(x))
 	# Combine state and bill name columns into id column
 	data["bill_id"] = data["state"].astype(str) + " " + data["bill_name"].astype(str)
@@ -217,17 +155,25 @@ if __name__ == "__main__":
 		checkpoint = "t5-small"
 		tokenizer = AutoTokenizer.from_pretrained(checkpoint)
 
-		logger.info('Creating token list lengths')
-		filtered_data['token_list'] = filtered_data['split_cleaned_text'].apply(lambda x: [tokenizer(i)["input_ids"] for i in x])
-		# Calculate the length of the token list & split
-		filtered_data['token_list_lens'] = filtered_data['token_list'].apply(lambda x: [len(i)-1 for i in x])
-		filtered_data['split_idx_list'] = filtered_data['token_list_lens'].apply(lambda x: doc_splitting(x))
-		# Split text using function
-		filtered_data['split_text_512'] = filtered_data.apply(lambda x: text_split(x['split_cleaned_text'], x['split_idx_list']), axis=1)
+		logger.info('Packing sections into token limited chunks')
+		# Tokenize the sections of every bill in one batch and pack them into the fewest balanced chunks,
+		# splitting any section that is over the token limit instead of letting the model truncate it; the chunk
+		# input ids (with the same prefix as preprocess_function) are saved so main.py does not tokenize them again
+		filtered_data['split_text_512'], filtered_data['input_ids'], bill_chunk_stats = pack_sections(
+			tokenizer, list(filtered_data['split_cleaned_text']), prefix = "summarize: ")
+		chunk_report = pd.DataFrame(bill_chunk_stats, index = filtered_data['bill_id'])
+		logger.info(f'Chunk count and fill ratio per bill:\n{chunk_report}')
+		logger.info(f'{chunk_report["chunks"].sum()} chunks in total, mean fill ratio {chunk_report["fill_ratio"].mean():.3f}')
 		
+		# A bill whose cleaned text is empty has no chunks and would explode into a row without text
+		empty_bills = filtered_data['split_text_512'].map(len) == 0
+		if empty_bills.any():
+			logger.info(f'Skipping {empty_bills.sum()} bills without any text to split: {list(filtered_data.loc[empty_bills, "bill_id"])}')
+			filtered_data = filtered_data[~empty_bills]
+
 		logger.info('Creating individual chunk rows')
-		# Explode the split text 512 column so each row is one chunk
-		filtered_data = filtered_data.explode('split_text_512', ignore_index=True)
+		# Explode the split text 512 and input id columns so each row is one chunk
+		filtered_data = filtered_data.explode(['split_text_512', 'input_ids'], ignore_index=True)
 
 		logger.info('Adding document number for each chunk and concatenating strings together')
 		# Create a group by index number to keep track of chunks
@@ -239,7 +185,7 @@ if __name__ == "__main__":
 		# Save output
 		outputFile = os.path.join(args.outdir, f"text_and_summaries_filtered_split_{timeTag}.csv")
 		# Reorder columns, include new split column and doc num col
-		filtered_data = filtered_data[["state_name", "state", "bill_id", "bill_name", "doc_number", "split_text", "summary", "summary_source", "category", "status", "link"]]
+		filtered_data = filtered_data[["state_name", "state", "bill_id", "bill_name", "doc_number", "split_text", "input_ids", "summary", "summary_source", "category", "status", "link"]]
 	else:
 		logger.info('Prepping for saving output')
 		# Reorder columns
@@ -1,68 +1,147 @@
 # Template Source: https://alaminmusamagaga.medium.com/text-summarization-app-with-flask-and-sumy-92212bd05705
 
+import os
+import json
 import time
-import spacy
-import numpy as np
+import logging
 
-from math import log
-from flask import Flask,render_template,url_for,request
-from transformers import AutoTokenizer, pipeline
-from bill_text_cleaner_splitter import BillTextCleaner, BillTextSplitter
+from flask import Flask,render_template,url_for,request,jsonify,Response
+from bill_text_cleaner_splitter import BillTextSplitter, clean_bills, pack_sections, load_lexicon
+from model_registry import ModelRegistry
+from summary_generator import SummaryCache, GENERATION_PRESETS
+from inference_worker import InferenceWorker
+from jobs import JobManager
+from reading_time import reading_time
 
-nlp = spacy.load("en_core_web_sm")
+logging.basicConfig(level = logging.INFO)
 app = Flask(__name__)
 
-def summarizer(split_text, model_type):
+# Keep the summaries of recently seen chunks in memory and on disk (shared by the server processes and kept
+# across restarts), so well-known bills are not generated again
+cache = SummaryCache(os.environ.get("BASL_SUMMARY_CACHE", "summary_cache.sqlite"))
+
+# Load each summarization model once per process instead of once per request
+# (set BASL_QUANTIZED=1 to serve the int8 quantized models on CPU-only machines, or BASL_BACKEND=onnxruntime
+# to serve the ONNX exports of the checkpoints)
+registry = ModelRegistry(max_models = 2, batch_size = 8, quantized = os.environ.get("BASL_QUANTIZED") == "1",
+                         backend = os.environ.get("BASL_BACKEND", "pytorch"), cache = cache)
+registry.register("t5-split", "summarizer_model")
+registry.register("t5-no-split", "summarizer_model_not-split")
+
+# Run every generate call on one background worker that batches the chunks of concurrent requests together
+worker = InferenceWorker(registry, max_batch_size = 8, max_wait = 0.02)
+
+# Long bills can be summarized in the background: at most two jobs are preprocessed and split at once, and
+# their chunks go through the same batching worker as the interactive requests; the jobs are recorded in the
+# cache's SQLite file, so a job submitted to one gunicorn worker can be polled from any other (with the cache
+# file disabled, serve /jobs from a single worker)
+jobs = JobManager(max_workers = 2, path = cache.path)
+
+# Memory-map the compiled lexicon once; every worker process shares the same physical pages
+WORDS_PATH = "our_words.txt"
+load_lexicon(WORDS_PATH)
+
+INVALID_REQUEST = f"input_text, a model_choice of t5-split or t5-no-split and a preset of {', '.join(GENERATION_PRESETS)} are required"
+
+def summarizer(split_text, model_type, progress = None, preset = "pipeline"):
    """Function to calculate the summary from the cleaned input text depending on the input model"""
-   model_summary = ""
-   if model_type == "t5-split":
-      # Build the summarizer pipeline
-      summarizer = pipeline("summarization", model = str("summarizer_model"))
-      # Get the summary by section and append to overall summary
-      for section in split_text:
-         model_summary += summarizer(" ".join(section))[0]["summary_text"]
-   elif model_type == "t5-no-split":
-      # Build the summarizer pipeline
-      summarizer = pipeline("summarization", model = str("summarizer_model_not-split"))
-      # Summarizer on full text
-      model_summary = summarizer(" ".join(split_text))[0]["summary_text"]
-   return model_summary
+   # Summarize the token ids of all chunks in shared batches and append them to the overall summary in chunk order
+   return "".join(worker.summarize_ids(model_type, chunk_ids_for(split_text, model_type), progress = progress, preset = preset))
 
 def text_preprocessing(text):
    """Function to process the bill text"""
-   words = open("our_words.txt").read().split()
-   wordcost = dict((k, log((i+1)*log(len(words)))) for i,k in enumerate(words))
-   maxword = max(len(x) for x in words)
-   clean_text = BillTextCleaner(text, wordcost, maxword).get_clean_text()
+   # A single bill is cleaned in this process; clean_bills reuses the lexicon loaded above
+   clean_text = clean_bills([text], WORDS_PATH, workers = 1)[0]
    split_clean_text = BillTextSplitter(clean_text).get_split_text()
    return split_clean_text
 
-def doc_splitter(split_text):
+def doc_splitter(split_text, summarizer):
    """Function to dynamically split the text to abide by the 512 token limit"""
-   # Define tokenizer
-   checkpoint = "t5-small"
-   tokenizer = AutoTokenizer.from_pretrained(checkpoint)
-   # Get list of tokens
-   token_list = [tokenizer(i)["input_ids"] for i in split_text]
-   # Get length of each chunk
-   token_list_len = [len(i)-1 for i in token_list]
-   total_sum = 0
-   idx_list = []
-   for i,l in enumerate(token_list_len):
-      if total_sum + l + 1 > 512: 
-         # Add split location to list of indices for splitting
-         idx_list.append(i) 
-         # Reset to 0
-         total_sum = 0 
-      total_sum += l
-   # Split into chunks
-   return [list(i) for i in np.split(np.array(split_text), idx_list)]
+   # Pack the sections into the fewest balanced chunks, splitting any section over the limit; the chunks come
+   # out as the model's input ids (with its prefix) so they are not tokenized a second time
+   chunks, chunk_ids, stats = pack_sections(summarizer.tokenizer, [split_text], prefix = summarizer.prefix)
+   app.logger.info(f"Split the bill into {stats[0]['chunks']} chunks with fill ratio {stats[0]['fill_ratio']}")
+   return chunk_ids[0]
+
+def summarize_bill(input_text, model_type, preset = "pipeline", progress = None):
+   """Function to run all stages on a raw bill text, reporting progress(chunks_done, chunks_total) as chunks finish"""
+   return summarizer(text_preprocessing(input_text), model_type, progress = progress, preset = preset)
+
+def chunk_ids_for(split_text, model_type):
+   """Function to get the token ids of the chunks the summary is generated from, depending on the input model"""
+   # Get the warm summarizer from the model registry
+   summarizer = registry.get(model_type).summarizer
+   if model_type == "t5-split":
+      return doc_splitter(split_text, summarizer)
+   # One chunk with the full text
+   return summarizer.encode([" ".join(split_text)])
+
+def request_params():
+   """Function to read the bill text, model and generation preset of a form or JSON request (None if invalid)"""
+   params = request.get_json(silent = True) or request.form
+   input_text = params.get("input_text")
+   model_choice = params.get("model_choice", "t5-split")
+   preset = params.get("preset", "pipeline")
+   if not input_text or model_choice not in ("t5-split", "t5-no-split") or preset not in GENERATION_PRESETS:
+      return None
+   return input_text, model_choice, preset
 
 def readingTime(mytext):
    """Function to calculate the reading time of the bill text and summary"""
-   total_words = len([ token.text for token in nlp(mytext)])
-   estimatedTime = total_words/200.0
-   return estimatedTime
+   # Only the tokens are counted, so a regex tokenizer replaces the full spaCy pipeline (see reading_time.py)
+   return reading_time(mytext)
+
+@app.route('/models')
+def models():
+   """Report the load time and resident size of each loaded model"""
+   return jsonify(registry.get_stats())
+
+@app.route('/metrics')
+def metrics():
+   """Report the inference queue depth, batch sizes, request latency percentiles and summary cache hit rate"""
+   return jsonify({**worker.get_stats(), "cache": cache.get_stats()})
+
+@app.route('/jobs', methods = ['POST'])
+def submit_job():
+   """Start summarizing a bill in the background and return its job id right away"""
+   params = request_params()
+   if params is None:
+      return jsonify({"error": INVALID_REQUEST}), 400
+   job = jobs.submit(summarize_bill, *params)
+   return jsonify(job.to_dict()), 202, {"Location": url_for("job_status", job_id = job.id)}
+
+@app.route('/jobs/<job_id>')
+def job_status(job_id):
+   """Report the status, chunks done out of total and, once finished, the summary of a job"""
+   job = jobs.get(job_id)
+   if job is None:
+      return jsonify({"error": f"Unknown job {job_id}"}), 404
+   return jsonify(job.to_dict())
+
+@app.route('/stream', methods = ['POST'])
+def stream():
+   """Stream each chunk's summary as a server-sent event as soon as it is generated"""
+   start = time.time()
+   params = request_params()
+   if params is None:
+      return jsonify({"error": INVALID_REQUEST}), 400
+   input_text, model_choice, preset = params
+   chunk_ids = chunk_ids_for(text_preprocessing(input_text), model_choice)
+
+   def events():
+      # Flask closes this generator when the client disconnects, which cancels the chunks not generated yet
+      chunks = worker.stream_ids(model_choice, chunk_ids, preset)
+      try:
+         for doc_number, summary in chunks:
+            event = {"doc_number": doc_number, "chunks_total": len(chunk_ids), "summary": summary,
+                     "seconds": round(time.time() - start, 2)}
+            yield f"event: chunk\ndata: {json.dumps(event)}\n\n"
+         yield f"event: done\ndata: {json.dumps({'chunks_total': len(chunk_ids), 'seconds': round(time.time() - start, 2)})}\n\n"
+      finally:
+         chunks.close()
+
+   return Response(events(), mimetype = "text/event-stream",
+                   headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
 
 @app.route('/')
 def index():
@@ -71,15 +150,18 @@ def index():
 def process():
       start = time.time()
       if request.method == "POST":
-         input_text = request.form["input_text"]
-         model_choice = request.form["model_choice"]
+         # An unknown model or preset is the client's mistake, not a failure of the inference worker
+         params = request_params()
+         if params is None:
+            return jsonify({"error": INVALID_REQUEST}), 400
+         input_text, model_choice, preset = params
          final_reading_time = readingTime(input_text)
          if model_choice == "t5-split":
-            clean_split_text = doc_splitter(text_preprocessing(input_text))
-            final_summary = summarizer(clean_split_text, "t5-split")
+            clean_split_text = text_preprocessing(input_text)
+            final_summary = summarizer(clean_split_text, "t5-split", preset = preset)
          elif model_choice == "t5-no-split":
             clean_text = text_preprocessing(input_text)
-            final_summary = summarizer(clean_text, "t5-no-split")
+            final_summary = summarizer(clean_text, "t5-no-split", preset = preset)
       summary_reading_time = readingTime(final_summary)
       end = time.time()
       final_time = end-start
@@ -90,4 +172,10 @@ def process():
                               final_summary = final_summary,
                               model_selected = model_choice)
 
-app.run(host = "0.0.0.0", port = 8000)
\ No newline at end of file
+# Load the models at import time, so `gunicorn app:app` (see gunicorn.conf.py) loads them once in the master
+# process before it forks the workers
+registry.preload()
+
+# run the development server with `python app.py`
+if __name__ == "__main__":
+   app.run(host = "0.0.0.0", port = 8000)
@@ -1,15 +1,25 @@
 import re
+import os
+import mmap
+import struct
+import numpy as np
+
 from math import log
+from array import array
+from concurrent.futures import ProcessPoolExecutor
 
 
 class BillTextCleaner:
-    def __init__(self, text, wordcost, maxword):
+    def __init__(self, text, wordcost = None, maxword = None, segmenter = None):
         """
-        Initialize the BillTextCleaner class with an input text and parameters required for infering spaces
+        Initialize the BillTextCleaner class with an input text and parameters required for infering spaces;
+        pass a prebuilt WordSegmenter (e.g. over a compiled lexicon) instead to avoid rebuilding the lexicon
+        for every bill
         """
         self.initial_text = text
         self.wordcost = wordcost
         self.maxword = maxword
+        self.segmenter = segmenter
         self.initial_clean()
         self.infer_spaces()
         self.text_shortener()
@@ -21,39 +31,16 @@ class BillTextCleaner:
         """ 
 	    Function to initial clean the bill text before infering spaces
         """
-        # Remove all spaces and convert to lower case
-        self.clean_text = re.sub(r'\s+', "", self.initial_text.lower())
-        # Find the section headers and flag them with the phrase "sectionheaderflag" for future splitting
-        header_expressions = [r'hb\d+', r'\\[a-z]+\b', r'\\\d+\b', r'hb\d+', r'sb\d+', r'hf\d+', r'sf\d+', r'\d+']
-        for exp in header_expressions:
-            self.clean_text = re.sub(exp, "sectionheaderflag", self.clean_text)
-        # Remove additional punctuation
-        self.clean_text = re.sub(r'[^\w\s]', "", self.clean_text)
+        self.clean_text = normalize_bill_text(self.initial_text)
 
     def infer_spaces(self):
         """
         Uses dynamic programming to infer the location of spaces in a string without spaces
         Source code: https://stackoverflow.com/questions/8870261/how-to-split-text-without-spaces-into-list-of-words
         """
-        # Find the best match for the i first characters, assuming cost has been built for the i-1 first characters.
-        # Returns a pair (match_cost, match_length)
-        def best_match(i):
-            candidates = enumerate(reversed(cost[max(0, i - self.maxword):i]))
-            return min((c + self.wordcost.get(self.clean_text[i-k-1:i], 9e999), k+1) for k,c in candidates)
-        # Build the cost array.
-        cost = [0]
-        for i in range(1,len(self.clean_text)+1):
-            c, k = best_match(i)
-            cost.append(c)
-        # Backtrack to recover the minimal-cost string.
-        out = []
-        i = len(self.clean_text)
-        while i > 0:
-            c, k = best_match(i)
-            assert c == cost[i]
-            out.append(self.clean_text[i-k:i])
-            i -= k
-        self.clean_text = " ".join(reversed(out))
+        if self.segmenter is None:
+            self.segmenter = WordSegmenter(self.wordcost, self.maxword)
+        self.clean_text = self.segmenter.segment(self.clean_text)
 
     def text_shortener(self):
         """
@@ -61,28 +48,280 @@ class BillTextCleaner:
         (e.g. 'be enacted by...'); other uneccesary phrases will be removed too; section headers will be 
         replaced with numbers to be split on during document splitting
         """
-        enact_str = r"be it enacted by|enact as follows|state of [a-z]+ enact|assembly of [a-z ]+ enact"
-        # Find where the bill is enacted
-        if re.search(enact_str, self.clean_text.lower()):
-            enacted_by_index = re.search(enact_str, self.clean_text.lower()).start() 
-        else:
-            enacted_by_index = 0
-        self.clean_text = self.clean_text[enacted_by_index:]
-        # Start at the section
-        if "section" in self.clean_text.lower():
-            first_section_index = re.search("section", self.clean_text.lower()).start()
+        self.clean_text = shorten_bill_text(self.clean_text)
+
+# Precompiled patterns for normalizing bill text. The section header patterns used to be substituted one
+# after another: hb\d+, \\[a-z]+\b, \\\d+\b, hb\d+ (again, a no-op), sb\d+, hf\d+, sf\d+ and \d+. Patterns that can
+# never overlap or feed each other are fused into one alternation below, but hb\d+ has to run before the
+# backslash pattern (it can turn "\hb12" into "\sectionheaderflag") and \d+ has to run last. A single
+# alternation over all of them measured slower than these literal-prefixed passes in CPython's re.
+SECTION_HEADERS = [re.compile(r'hb\d+'), re.compile(r'\\(?:[a-z]+|\d+)\b'), re.compile(r'(?:sb|hf|sf)\d+'), re.compile(r'\d+')]
+PUNCTUATION = re.compile(r'[^\w\s]+')
+ENACTED = re.compile(r"be it enacted by|enact as follows|state of [a-z]+ enact|assembly of [a-z ]+ enact")
+COMMON_PHRASE = re.compile(r'new text underlined deleted text bracketed', flags = re.IGNORECASE)
+REPEATED_LETTER = re.compile(r'\b(\w)\s?\1\s?\1\b')
+# Checking the word boundary before the lookbehind lets most positions fail fast
+SINGLE_LETTER = re.compile(r'\b(?<!\b[a])\w\b(?!([a]\b|\w))')
+
+def normalize_bill_text(text):
+    """
+    Remove all spaces, lower case the text, flag the section headers with the phrase "sectionheaderflag" for
+    future splitting and remove additional punctuation
+    """
+    # str.split() splits on exactly the characters \s matches
+    text = "".join(text.lower().split())
+    for header in SECTION_HEADERS:
+        text = header.sub("sectionheaderflag", text)
+    return PUNCTUATION.sub("", text)
+
+def shorten_bill_text(text):
+    """
+    Start the text at the phrase that marks the start of the bill and then at the first section, remove
+    unnecessary phrases and letters, and replace section headers with a period for splitting
+    """
+    lower_text = text.lower()
+    # Find where the bill is enacted
+    enacted_by = ENACTED.search(lower_text)
+    enacted_by_index = enacted_by.start() if enacted_by else 0
+    # Start at the section
+    first_section_index = max(lower_text.find("section", enacted_by_index), enacted_by_index)
+    text = text[first_section_index:]
+    # Common phrase among bill to remove
+    text = COMMON_PHRASE.sub(' ', text)
+    # Remove any patterns of multiple letters separated by spaces: "a a a" or "aa"
+    text = REPEATED_LETTER.sub(' ', text)
+    # Remove all single letter characters remaining except for "a" and "i" because those are actual full words
+    text = SINGLE_LETTER.sub('', text)
+    # Replace section headers with a period for splitting
+    return text.replace("section header flag", ".")
+
+class WordSegmenter:
+    def __init__(self, wordcost = None, maxword = None, lexicon = None):
+        """
+        Initialize the WordSegmenter class from either a word cost dictionary, which is turned into a prefix
+        trie (each trie node is a dict from the next character to the child node, and nodes that end a word
+        hold the word cost under None), or a memory-mapped CompiledLexicon
+        """
+        self.lexicon = lexicon
+        self.trie = {}
+        if lexicon is not None:
+            return
+        for word, cost in wordcost.items():
+            if maxword is not None and len(word) > maxword:
+                continue
+            node = self.trie
+            for char in word:
+                node = node.setdefault(char, {})
+            node[None] = cost
+
+    def segment(self, text):
+        """
+        Infer the minimal-cost spacing of a string without spaces; this is the same dynamic program as the
+        Stack Overflow source of infer_spaces (same costs and tie-breaking, so identical output), but each
+        position only visits the dictionary words that actually start there by walking the trie
+        """
+        n = len(text)
+        inf = float("inf")
+        # cost[i] is the best cost of the first i characters and length[i] the length of the last word in it;
+        # positions no word reaches keep an infinite cost and fall back to a single character like the original
+        cost = array("d", [inf]) * (n + 1)
+        length = array("H", [1]) * (n + 1)
+        cost[0] = 0.0
+        if self.lexicon is not None:
+            self.lexicon.fill_costs(text, cost, length)
         else:
-            first_section_index = 0
-        self.clean_text = self.clean_text[first_section_index:]
-        # Common phrase among bill to remove
-        self.clean_text = re.sub(r'new text underlined deleted text bracketed', ' ', self.clean_text, flags = re.IGNORECASE)
-        # Remove any patterns of multiple letters separated by spaces: "a a a" or "aa"
-        self.clean_text = re.sub(r'\b(\w)\s?\1\s?\1\b', ' ', self.clean_text)
-        # Remove all single letter characters remaining except for "a" and "i" because those are actual full words
-        self.clean_text = re.sub(r'(?<!\b[a])\b\w\b(?!([a]\b|\w))', '', self.clean_text)
-        # Replace section headers with a period for splitting
-        self.clean_text = self.clean_text.replace("section header flag", ".")
-        self.clean_text.strip()
+            self.fill_costs(text, cost, length)
+        # Backtrack through the stored word lengths to recover the minimal-cost string
+        out = []
+        i = n
+        while i > 0:
+            out.append(text[i - length[i]:i])
+            i -= length[i]
+        return " ".join(reversed(out))
+
+    def fill_costs(self, text, cost, length):
+        """
+        Forward pass of the dynamic program over the dict trie
+        """
+        n = len(text)
+        inf = float("inf")
+        trie = self.trie
+        for start in range(n):
+            start_cost = cost[start]
+            if start_cost == inf:
+                continue
+            node = trie
+            for end in range(start + 1, n + 1):
+                node = node.get(text[end - 1])
+                if node is None:
+                    break
+                word_cost = node.get(None)
+                if word_cost is not None:
+                    c = start_cost + word_cost
+                    # Ties go to the shorter last word, as in min() over (cost, length) pairs
+                    if c < cost[end] or (c == cost[end] and end - start < length[end]):
+                        cost[end] = c
+                        length[end] = end - start
+
+class CompiledLexicon:
+    # File layout: magic, array size and longest word, then the base, check and cost arrays of a double-array trie
+    MAGIC = b"BASLLEX1"
+    HEADER = struct.Struct("<8sii")
+
+    def __init__(self, path):
+        """
+        Initialize the CompiledLexicon class by memory-mapping a file written by compile_lexicon read-only; every
+        process that maps the same file shares one physical copy of it through the page cache
+        """
+        self.path = path
+        with open(path, "rb") as f:
+            self.mmap = mmap.mmap(f.fileno(), 0, access = mmap.ACCESS_READ)
+        magic, self.size, self.maxword = self.HEADER.unpack_from(self.mmap)
+        if magic != self.MAGIC:
+            raise ValueError(f"{path} is not a compiled lexicon")
+        view = memoryview(self.mmap)
+        offset = self.HEADER.size
+        self.base = view[offset:offset + 4 * self.size].cast("i")
+        offset += 4 * self.size
+        self.check = view[offset:offset + 4 * self.size].cast("i")
+        offset += 4 * self.size
+        self.cost = view[offset:offset + 8 * self.size].cast("d")
+
+    def fill_costs(self, text, cost, length):
+        """
+        Forward pass of the dynamic program over the double-array trie: from state s, letter code c leads to
+        state base[s] + c if check[base[s] + c] == s
+        """
+        n = len(text)
+        inf = float("inf")
+        base, check, word_costs = self.base, self.check, self.cost
+        codes = [ord(char) - 96 for char in text]
+        for start in range(n):
+            start_cost = cost[start]
+            if start_cost == inf:
+                continue
+            state = 0
+            for end in range(start + 1, n + 1):
+                code = codes[end - 1]
+                if not 0 < code < 27:
+                    break
+                child = base[state] + code
+                if check[child] != state:
+                    break
+                state = child
+                word_cost = word_costs[state]
+                if word_cost != inf:
+                    c = start_cost + word_cost
+                    # Ties go to the shorter last word, as in min() over (cost, length) pairs
+                    if c < cost[end] or (c == cost[end] and end - start < length[end]):
+                        cost[end] = c
+                        length[end] = end - start
+
+def compile_lexicon(words_path, lexicon_path):
+    """
+    Build a double-array trie of the word list (with the Zipf costs used by infer_spaces) and write it to a
+    file that CompiledLexicon can memory-map; the file is written under a temporary name and moved into place
+    so concurrent readers never see a partial file
+    """
+    words = open(words_path).read().split()
+    wordcost = dict((k, log((i+1)*log(len(words)))) for i,k in enumerate(words))
+    trie = WordSegmenter(wordcost).trie
+    inf = float("inf")
+    size = 1 << 16
+    base, check, cost = array("i", [0]) * size, array("i", [-1]) * size, array("d", [inf]) * size
+    # used marks taken slots so that free slots for a node's children can be searched for at C speed
+    used = bytearray(size)
+    used[0] = 1
+    check[0] = 0
+    first_free = 1
+    patterns = {}
+    queue = [(trie, 0)]
+    for node, state in queue:
+        codes = sorted(ord(char) - 96 for char in node if char is not None)
+        if not codes:
+            continue
+        # Find the first free slot for the smallest child whose sibling slots are all free too
+        gaps = tuple(c - p - 1 for p, c in zip(codes, codes[1:]))
+        if gaps not in patterns:
+            patterns[gaps] = re.compile(b"\\x00(?=" + b"".join(b"[\\s\\S]{%d}\\x00" % gap for gap in gaps) + b")")
+        while True:
+            if gaps:
+                match = patterns[gaps].search(used, max(first_free, codes[0] + 1))
+                slot = match.start() if match else -1
+            else:
+                slot = used.find(0, max(first_free, codes[0] + 1))
+            if slot != -1 and slot - codes[0] + 27 < len(used):
+                break
+            used.extend(bytes(size))
+            base.extend(array("i", [0]) * size)
+            check.extend(array("i", [-1]) * size)
+            cost.extend(array("d", [inf]) * size)
+            size *= 2
+        base[state] = slot - codes[0]
+        for char, child in node.items():
+            if char is None:
+                continue
+            child_state = base[state] + ord(char) - 96
+            used[child_state] = 1
+            check[child_state] = state
+            cost[child_state] = child.get(None, inf)
+            queue.append((child, child_state))
+        while used[first_free]:
+            first_free += 1
+    # Trim the arrays, keeping room for every transition out of the last used base
+    size = max(used.rfind(1), max(base)) + 27
+    tmp_path = f"{lexicon_path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(CompiledLexicon.HEADER.pack(CompiledLexicon.MAGIC, size, max(len(x) for x in words)))
+        f.write(base[:size].tobytes())
+        f.write(check[:size].tobytes())
+        f.write(cost[:size].tobytes())
+    os.replace(tmp_path, lexicon_path)
+
+_lexicons = {}
+
+def load_lexicon(words_path, lexicon_path = None):
+    """
+    Return the memory-mapped compiled lexicon for a word list, compiling it next to the word list first if it
+    is missing or older than the word list; lexicons are loaded once per process
+    """
+    lexicon_path = lexicon_path or os.path.splitext(words_path)[0] + ".lex"
+    if lexicon_path not in _lexicons:
+        if not os.path.exists(lexicon_path) or os.path.getmtime(lexicon_path) < os.path.getmtime(words_path):
+            compile_lexicon(words_path, lexicon_path)
+        _lexicons[lexicon_path] = CompiledLexicon(lexicon_path)
+    return _lexicons[lexicon_path]
+
+# Word segmenter of a clean_bills worker process, built once from the shared lexicon
+_worker_segmenter = None
+
+def _init_clean_worker(words_path):
+    global _worker_segmenter
+    _worker_segmenter = WordSegmenter(lexicon = load_lexicon(words_path))
+
+def _clean_worker_bill(text):
+    return BillTextCleaner(text, segmenter = _worker_segmenter).get_clean_text()
+
+def clean_bills(texts, words_path, workers = None):
+    """
+    Clean many bills at once, returning the clean texts in the same order as the input texts; bills are
+    fanned out to a pool of worker processes (one per CPU by default) that each load the compiled lexicon once,
+    and workers = 1 cleans them one by one in this process
+    Params:
+        texts: iterable of raw bill texts
+        words_path: path of the word list the lexicon is compiled from (e.g. our_words.txt)
+        workers: number of cleaning processes
+    """
+    texts = list(texts)
+    # Compile the lexicon here first so the workers never race to write it
+    lexicon = load_lexicon(words_path)
+    workers = min(workers or os.cpu_count(), len(texts))
+    if workers <= 1:
+        segmenter = WordSegmenter(lexicon = lexicon)
+        return [BillTextCleaner(text, segmenter = segmenter).get_clean_text() for text in texts]
+    with ProcessPoolExecutor(max_workers = workers, initializer = _init_clean_worker, initargs = (words_path,)) as pool:
+        # map hands results back in input order however long each bill takes
+        return list(pool.map(_clean_worker_bill, texts))
 
 class BillTextSplitter:
     def __init__(self, text):
@@ -102,4 +341,135 @@ class BillTextSplitter:
         # Split on periods set while cleaning the data
         self.split_text = self.text.split(".")
         self.split_text = [phrase.strip()for phrase in self.split_text]
-        self.split_text =  list(filter(lambda x: x != '', self.split_text))
\ No newline at end of file
+        self.split_text =  list(filter(lambda x: x != '', self.split_text))
+
+def token_split_indices(lengths, max_token_len = 512):
+    """
+    Return the section indices to split a bill at so each chunk stays within the token limit; gives exactly
+    the split locations of the original running-sum loop (including a split at 0 when the first section
+    alone is too long), but jumps from chunk to chunk with a binary search over the cumulative lengths
+    Params:
+        lengths: token length of each section, without the end token
+        max_token_len: token limit of a chunk, counting the one end token T5 adds
+    """
+    lengths = np.asarray(lengths, dtype = np.int64)
+    n = len(lengths)
+    cumulative = np.concatenate(([0], np.cumsum(lengths)))
+    idx_list = [0] if n and lengths[0] + 1 > max_token_len else []
+    start = 0
+    while True:
+        # The chunk starting at start ends right before the first section that pushes it over the limit,
+        # and always keeps at least one section
+        end = max(int(np.searchsorted(cumulative, cumulative[start] + max_token_len - 1, side = "right")) - 1, start + 1)
+        if end >= n:
+            return idx_list
+        idx_list.append(end)
+        start = end
+
+def balanced_split_indices(lengths, budget):
+    """
+    Return split indices that pack sections into the fewest chunks whose token sum stays within the budget,
+    with the largest chunk as small as possible; greedy packing already gives the fewest chunks, so this binary
+    searches for the smallest capacity that still needs no more chunks and packs with that capacity instead,
+    which spreads the tokens over the chunks instead of leaving a tiny trailing chunk
+    Params:
+        lengths: token length of each section, none of them over the budget
+        budget: largest token sum of a chunk
+    """
+    lengths = np.asarray(lengths, dtype = np.int64)
+    if len(lengths) == 0:
+        return []
+    # token_split_indices counts the end token, so a capacity c is a token limit of c + 1
+    count = len(token_split_indices(lengths, budget + 1)) + 1
+    low, high = max(int(lengths.max()), -(-int(lengths.sum()) // count)), budget
+    while low < high:
+        capacity = (low + high) // 2
+        if len(token_split_indices(lengths, capacity + 1)) + 1 <= count:
+            high = capacity
+        else:
+            low = capacity + 1
+    return token_split_indices(lengths, low + 1)
+
+def section_token_ids(tokenizer, bills):
+    """
+    Tokenize the sections of many bills in one batched tokenizer call, without special tokens, and return the
+    flat list of their input ids along with the offsets such that ids[offsets[b]:offsets[b + 1]] belong to bill b
+    Params:
+        tokenizer: a Hugging Face tokenizer
+        bills: list with one list of section strings per bill
+    """
+    sections = [section for bill in bills for section in bill]
+    offsets = np.cumsum([0] + [len(bill) for bill in bills])
+    if not sections:
+        return [], offsets
+    return tokenizer(sections, add_special_tokens = False, return_attention_mask = False)["input_ids"], offsets
+
+def split_long_section(tokenizer, section, budget):
+    """
+    Split a section with more tokens than the budget into balanced pieces at word boundaries, and a word that
+    is itself over the budget at token boundaries; returns the pieces and their input ids
+    Params:
+        tokenizer: a Hugging Face tokenizer
+        section: the section string
+        budget: largest token length of a piece
+    """
+    words, word_ids = [], []
+    for word, ids in zip(section.split(), section_token_ids(tokenizer, [section.split()])[0]):
+        if len(ids) <= budget:
+            words.append(word)
+            word_ids.append(ids)
+            continue
+        offsets = tokenizer(word, add_special_tokens = False, return_offsets_mapping = True)["offset_mapping"]
+        for start in range(0, len(ids), budget):
+            group = offsets[start:start + budget]
+            words.append(word[group[0][0]:group[-1][1]])
+            word_ids.append(ids[start:start + budget])
+    bounds = [0] + balanced_split_indices([len(ids) for ids in word_ids], budget) + [len(words)]
+    pieces = [" ".join(words[start:end]) for start, end in zip(bounds, bounds[1:])]
+    return pieces, [[i for ids in word_ids[start:end] for i in ids] for start, end in zip(bounds, bounds[1:])]
+
+def pack_sections(tokenizer, bills, max_token_len = 512, prefix = ""):
+    """
+    Pack the sections of many bills into as few chunks per bill as fit the model's token limit, with balanced
+    token counts; sections over the limit are split into pieces first instead of being truncated by the model.
+    The section token ids are kept, so every chunk also comes out as ready-to-generate input ids (prefix,
+    section tokens and end token) and does not need to be tokenized again
+    Params:
+        tokenizer: a Hugging Face tokenizer
+        bills: list with one list of section strings per bill
+        max_token_len: token limit of a chunk, counting the prefix and the one end token T5 adds
+        prefix: task prefix put in front of every chunk (e.g. "summarize: ")
+    Returns one list of chunks (each a list of section strings) per bill, one list of chunk input ids per
+    bill and the chunk stats of each bill
+    """
+    prefix_ids = tokenizer(prefix, add_special_tokens = False)["input_ids"] if prefix else []
+    budget = max_token_len - len(prefix_ids) - 1
+    ids, offsets = section_token_ids(tokenizer, bills)
+    bill_chunks, bill_chunk_ids, bill_stats = [], [], []
+    for b, sections in enumerate(bills):
+        units, unit_ids = [], []
+        for section, section_ids in zip(sections, ids[offsets[b]:offsets[b + 1]]):
+            if len(section_ids) > budget:
+                pieces, piece_ids = split_long_section(tokenizer, section, budget)
+                units += pieces
+                unit_ids += piece_ids
+            else:
+                units.append(section)
+                unit_ids.append(section_ids)
+        bounds = [0] + balanced_split_indices([len(u) for u in unit_ids], budget) + [len(units)] if units else [0]
+        bill_chunks.append([units[start:end] for start, end in zip(bounds, bounds[1:])])
+        chunk_ids = [prefix_ids + [i for u in unit_ids[start:end] for i in u] + [tokenizer.eos_token_id]
+                     for start, end in zip(bounds, bounds[1:])]
+        bill_chunk_ids.append(chunk_ids)
+        bill_stats.append(chunk_stats([len(c) for c in chunk_ids], max_token_len))
+    return bill_chunks, bill_chunk_ids, bill_stats
+
+def chunk_stats(chunk_lengths, max_token_len):
+    """
+    Function to report the number of chunks of a bill and how full they are on average
+    """
+    return {"chunks": len(chunk_lengths),
+            "tokens": sum(chunk_lengths),
+            "longest_chunk": max(chunk_lengths, default = 0),
+            "fill_ratio": round(sum(chunk_lengths) / (len(chunk_lengths) * max_token_len), 4) if chunk_lengths else 0.0}
+
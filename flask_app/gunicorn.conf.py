@@ -0,0 +1,38 @@
+import gc
+import os
+import multiprocessing
+import torch
+
+# run the app with `gunicorn app:app` from the flask_app directory
+# The master process imports app.py once, which loads and warms up every model and memory-maps the lexicon,
+# and then forks the workers; the workers share the pages of the model weights copy-on-write instead of each
+# loading its own copy
+preload_app = True
+bind = os.environ.get("BASL_BIND", "0.0.0.0:8000")
+workers = int(os.environ.get("BASL_WORKERS", 2))
+# Request threads of one worker mostly wait on its inference worker, which batches their chunks together
+worker_class = "gthread"
+threads = int(os.environ.get("BASL_THREADS", 8))
+# Long bills take a while to summarize on CPU
+timeout = int(os.environ.get("BASL_TIMEOUT", 300))
+
+# Every worker generates with its own intra-op thread pool, so split the cores between the workers instead of
+# letting each of them start a thread per core
+torch_threads = int(os.environ.get("BASL_TORCH_THREADS", max(multiprocessing.cpu_count() // workers, 1)))
+
+# gunicorn reads this file before the master imports app.py, so the models are loaded and warmed up with a
+# single torch thread. A warm-up with more threads starts GNU OpenMP's thread pool in the master, and a forked
+# worker that changes the thread count and generates then waits forever on the pool threads it did not inherit.
+# With one thread no pool is started, and every worker raises the count in post_fork
+torch.set_num_threads(1)
+
+
+def pre_fork(server, worker):
+    # Move everything loaded so far out of the garbage collector's generations; otherwise the collector writes
+    # to those objects in every worker and copies the pages they are on
+    gc.freeze()
+
+
+def post_fork(server, worker):
+    torch.set_num_threads(torch_threads)
+    server.log.info(f"Worker {worker.pid} generates with {torch_threads} torch threads")
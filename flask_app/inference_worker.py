@@ -0,0 +1,155 @@
+import os
+import time
+import queue
+import logging
+import threading
+from collections import Counter, deque
+from concurrent.futures import Future, as_completed
+
+logger = logging.getLogger(__name__)
+
+
+class InferenceWorker:
+    def __init__(self, registry, max_batch_size = 8, max_wait = 0.02):
+        """
+        Initialize a background worker that serves the generate calls of all requests: request threads queue
+        their tokenized chunks, and the worker coalesces the chunks of concurrent requests into shared batches,
+        waiting at most max_wait seconds after the first queued chunk for up to max_batch_size chunks
+        """
+        self.registry = registry
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.lock = threading.Lock()
+        self.queue = None
+        self.thread = None
+        self.pid = None
+        self.batches = 0
+        self.chunks = 0
+        self.decode_steps = 0
+        self.batch_sizes = Counter()
+        self.latencies = deque(maxlen = 1000)
+
+    def start(self):
+        """
+        Start the worker thread of this process if it is not running yet; threads do not survive a fork, so a
+        forked server worker starts its own thread (and queue) on its first request
+        """
+        with self.lock:
+            if self.pid != os.getpid():
+                self.queue = queue.Queue()
+                self.thread = threading.Thread(target = self.run, name = "inference-worker", daemon = True)
+                self.pid = os.getpid()
+                self.thread.start()
+                logger.info(f"Started inference worker in process {self.pid}")
+
+    def submit(self, model_name, input_ids, preset = "pipeline"):
+        """
+        Queue one tokenized chunk for a model and generation preset and return a future that will hold its summary
+        """
+        self.start()
+        future = Future()
+        self.queue.put(((model_name, preset), input_ids, future))
+        return future
+
+    def summarize_ids(self, model_name, chunk_ids, progress = None, preset = "pipeline"):
+        """
+        Summarize the tokenized chunks of one request through the shared batches; returns the summaries in
+        chunk order once all of them are done, calling progress(chunks_done, chunks_total) as chunks finish
+        """
+        start = time.time()
+        futures = [self.submit(model_name, input_ids, preset) for input_ids in chunk_ids]
+        if progress is not None:
+            # Report progress from the calling thread, so the worker thread never waits on a progress callback
+            progress(0, len(futures))
+            for chunks_done, _ in enumerate(as_completed(futures), 1):
+                progress(chunks_done, len(futures))
+        summaries = [future.result() for future in futures]
+        self.latencies.append(time.time() - start)
+        return summaries
+
+    def stream_ids(self, model_name, chunk_ids, preset = "pipeline"):
+        """
+        Generator over the summaries of one request's tokenized chunks, yielding (doc_number, summary) in chunk
+        order as soon as each chunk is done; closing the generator early (e.g. when the client disconnects)
+        cancels the chunks that have not started generating yet
+        """
+        start = time.time()
+        futures = [self.submit(model_name, input_ids, preset) for input_ids in chunk_ids]
+        try:
+            for doc_number, future in enumerate(futures, start = 1):
+                yield doc_number, future.result()
+            self.latencies.append(time.time() - start)
+        finally:
+            cancelled = sum(future.cancel() for future in futures)
+            if cancelled:
+                logger.info(f"Cancelled {cancelled} of {len(futures)} chunks of a closed stream")
+
+    def next_batch(self):
+        """
+        Block until a chunk is queued, then keep collecting chunks until the batch is full or max_wait has passed
+        """
+        batch = [self.queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self.queue.get(timeout = remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def run(self):
+        """
+        Worker loop: take the next batch, generate it model by model (and preset by preset) and hand each summary
+        to its future
+        """
+        while True:
+            # Chunks whose request has given up on them are dropped instead of generated
+            batch = [item for item in self.next_batch() if item[2].set_running_or_notify_cancel()]
+            by_model = {}
+            for item in batch:
+                by_model.setdefault(item[0], []).append(item)
+            for (model_name, preset), items in by_model.items():
+                try:
+                    summarizer = self.registry.get(model_name).summarizer
+                    summaries = summarizer.summarize_ids([input_ids for _, input_ids, _ in items], preset)
+                    self.decode_steps += summarizer.last_run_stats["decode_steps"]
+                except Exception as e:
+                    logger.exception(f"Generation failed for a batch of {len(items)} chunks")
+                    for _, _, future in items:
+                        future.set_exception(e)
+                    continue
+                for (_, _, future), summary in zip(items, summaries):
+                    future.set_result(summary)
+            if batch:
+                self.batches += 1
+                self.chunks += len(batch)
+                self.batch_sizes[len(batch)] += 1
+
+    def get_stats(self):
+        """
+        Return the queue depth, batch sizes, decode steps and request latency percentiles of this process
+        """
+        latencies = sorted(self.latencies)
+        return {"queue_depth": self.queue.qsize() if self.queue is not None and self.pid == os.getpid() else 0,
+                "max_batch_size": self.max_batch_size,
+                "max_wait_seconds": self.max_wait,
+                "batches": self.batches,
+                "chunks": self.chunks,
+                "mean_batch_size": round(self.chunks / self.batches, 2) if self.batches else 0.0,
+                "decode_steps_per_chunk": round(self.decode_steps / self.chunks, 1) if self.chunks else 0.0,
+                "batch_sizes": dict(sorted(self.batch_sizes.items())),
+                "requests": len(latencies),
+                "latency_p50_seconds": round(percentile(latencies, 50), 3),
+                "latency_p99_seconds": round(percentile(latencies, 99), 3)}
+
+
+def percentile(sorted_values, p):
+    """
+    Nearest-rank percentile of an already sorted list (0.0 for an empty list)
+    """
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(round(p / 100 * (len(sorted_values) - 1))))]
@@ -0,0 +1,160 @@
+import os
+import time
+import uuid
+import sqlite3
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+
+class Job:
+    def __init__(self, job_id):
+        """
+        Hold the state of one background summarization job
+        """
+        self.id = job_id
+        self.status = "queued"
+        self.chunks_done = 0
+        self.chunks_total = None
+        self.summary = None
+        self.error = None
+        self.created = time.time()
+        self.finished = None
+
+    @classmethod
+    def from_row(cls, row):
+        """
+        Rebuild a job from its row in the jobs table
+        """
+        job = cls(row[0])
+        job.status, job.chunks_done, job.chunks_total, job.summary, job.error, job.created, job.finished = row[1:]
+        return job
+
+    def to_row(self):
+        return (self.id, self.status, self.chunks_done, self.chunks_total, self.summary, self.error, self.created, self.finished)
+
+    def set_progress(self, chunks_done, chunks_total):
+        self.chunks_done = chunks_done
+        self.chunks_total = chunks_total
+
+    def to_dict(self):
+        return {"id": self.id,
+                "status": self.status,
+                "chunks_done": self.chunks_done,
+                "chunks_total": self.chunks_total,
+                "summary": self.summary,
+                "error": self.error,
+                "seconds": round((self.finished or time.time()) - self.created, 2)}
+
+
+class JobManager:
+    def __init__(self, max_workers = 2, max_jobs = 1000, path = None, save_interval = 1.0):
+        """
+        Initialize a bounded pool that runs summarization jobs in the background; at most max_workers jobs run
+        at once (the rest wait in the pool's queue) and only the max_jobs most recent jobs are kept for polling;
+        with a SQLite file the state of every job is also written to its jobs table, so a job can be polled from
+        any server process and not only from the one running it (its progress at most every save_interval seconds)
+        """
+        self.max_workers = max_workers
+        self.max_jobs = max_jobs
+        self.path = str(path) if path else None
+        self.save_interval = save_interval
+        self.jobs = OrderedDict()
+        self.lock = threading.Lock()
+        self.pool = None
+        self.pid = None
+        self.connection = None
+        self.connection_pid = None
+
+    def connect(self):
+        """
+        Open the SQLite file of this process; a connection does not survive a fork, so a forked server worker
+        opens its own
+        """
+        if self.connection_pid != os.getpid():
+            self.connection = sqlite3.connect(self.path, timeout = 30, check_same_thread = False)
+            self.connection.execute("PRAGMA journal_mode=WAL")
+            self.connection.execute("CREATE TABLE IF NOT EXISTS jobs (id TEXT PRIMARY KEY, status TEXT NOT NULL, "
+                                    "chunks_done INTEGER NOT NULL, chunks_total INTEGER, summary TEXT, error TEXT, "
+                                    "created REAL NOT NULL, finished REAL)")
+            self.connection.execute("CREATE INDEX IF NOT EXISTS jobs_created ON jobs (created)")
+            self.connection.commit()
+            self.connection_pid = os.getpid()
+        return self.connection
+
+    def save(self, job, evict = False):
+        """
+        Write the current state of a job to the jobs table (if there is one), optionally forgetting the oldest
+        jobs beyond the limit
+        """
+        if not self.path:
+            return
+        with self.lock:
+            connection = self.connect()
+            connection.execute("INSERT OR REPLACE INTO jobs VALUES (?, ?, ?, ?, ?, ?, ?, ?)", job.to_row())
+            if evict:
+                connection.execute("DELETE FROM jobs WHERE id NOT IN (SELECT id FROM jobs ORDER BY created DESC LIMIT ?)",
+                                   (self.max_jobs,))
+            connection.commit()
+
+    def submit(self, function, *args):
+        """
+        Create a job that runs function(*args, progress = ...) in the pool and return it right away; the progress
+        callback records the chunks done and total of the job
+        """
+        job = Job(uuid.uuid4().hex)
+        with self.lock:
+            # Threads do not survive a fork, so every server process starts its own pool on its first job
+            if self.pid != os.getpid():
+                self.pool = ThreadPoolExecutor(max_workers = self.max_workers, thread_name_prefix = "job")
+                self.pid = os.getpid()
+            self.jobs[job.id] = job
+            # Forget the oldest jobs beyond the limit
+            while len(self.jobs) > self.max_jobs:
+                self.jobs.popitem(last = False)
+        self.save(job, evict = True)
+        with self.lock:
+            self.pool.submit(self.run, job, function, *args)
+        return job
+
+    def run(self, job, function, *args):
+        """
+        Run one job, recording its summary or the error it failed with
+        """
+        last_saved = 0.0
+
+        def progress(chunks_done, chunks_total):
+            nonlocal last_saved
+            job.set_progress(chunks_done, chunks_total)
+            # Polls from this process read the job in memory; the other processes read the jobs table, which
+            # gets the progress at most every save_interval seconds instead of one commit per chunk
+            if time.time() - last_saved >= self.save_interval:
+                self.save(job)
+                last_saved = time.time()
+
+        job.status = "running"
+        self.save(job)
+        try:
+            job.summary = function(*args, progress = progress)
+            job.status = "done"
+        except Exception as e:
+            logger.exception(f"Job {job.id} failed")
+            job.error = f"{type(e).__name__}: {e}"
+            job.status = "failed"
+        job.finished = time.time()
+        self.save(job)
+
+    def get(self, job_id):
+        """
+        Return the job with an id, or None if there is no such job (or it was forgotten); jobs of this process
+        are read from memory and jobs of the other server processes from the jobs table
+        """
+        job = self.jobs.get(job_id)
+        if job is not None or not self.path:
+            return job
+        with self.lock:
+            row = self.connect().execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return Job.from_row(row) if row else None
@@ -0,0 +1,35 @@
+import time
+import argparse
+import requests
+
+from concurrent.futures import ThreadPoolExecutor
+from inference_worker import percentile
+
+def post_bill(url, text, model_choice):
+   """Send one bill to the summarizer and return the request latency in seconds"""
+   start = time.time()
+   response = requests.post(f"{url}/process", data = {"input_text": text, "model_choice": model_choice})
+   response.raise_for_status()
+   return time.time() - start
+
+# run script with `python load_test.py -f bill.txt -n 64 -c 8` while app.py is serving
+if __name__ == "__main__":
+   parser = argparse.ArgumentParser(description = "Send concurrent summarization requests and report the latency percentiles")
+   parser.add_argument("-f", "--infile", required = True, help = "Text file with the bill text to send")
+   parser.add_argument("-u", "--url", default = "http://localhost:8000", help = "Base URL of the app")
+   parser.add_argument("-m", "--model_choice", default = "t5-split", choices = ["t5-split", "t5-no-split"], help = "Model to request")
+   parser.add_argument("-n", "--requests", type = int, default = 32, help = "Total number of requests")
+   parser.add_argument("-c", "--concurrency", type = int, default = 8, help = "Number of requests in flight at once")
+   args = parser.parse_args()
+
+   with open(args.infile) as f:
+      text = f.read()
+   start = time.time()
+   with ThreadPoolExecutor(max_workers = args.concurrency) as pool:
+      latencies = sorted(pool.map(lambda _: post_bill(args.url, text, args.model_choice), range(args.requests)))
+   seconds = time.time() - start
+   print(f"{args.requests} requests at concurrency {args.concurrency} in {seconds:.1f}s "
+         f"({args.requests / seconds:.2f} requests/sec)")
+   print(f"p50 {percentile(latencies, 50):.2f}s  p99 {percentile(latencies, 99):.2f}s")
+   # The server side view: queue depth and how many chunks were batched together
+   print(requests.get(f"{args.url}/metrics").json())
